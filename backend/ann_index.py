@@ -0,0 +1,292 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from local_index import LocalVectorIndex, QueryResponse
+
+# Inverted-file (IVF) approximate nearest-neighbour index over the local
+# vector store.
+#
+# Vectors are grouped into `nlist` clusters with spherical k-means. A query
+# only scores the vectors in its `nprobe` closest clusters, so cost grows with
+# nprobe / nlist of the collection instead of all of it. Raising nprobe trades
+# latency for recall. New vectors are assigned to their nearest cluster as they
+# are upserted. Once the collection has grown well past the size it was
+# trained on, the clustering is retrained in a background thread and swapped
+# in, never on the upsert path. Until the index has been built once, queries
+# are exact.
+#
+#   python ann_index.py build                 # train and persist
+#   python ann_index.py recall --k 50         # recall@k vs exact search
+
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))            # 0 = pick from collection size
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "4.0"))
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK = 4096
+
+
+def default_nlist(n: int) -> int:
+    return max(1, min(4096, int(4 * np.sqrt(n))))
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+class IVFIndex:
+    def __init__(self, store: LocalVectorIndex, nlist: int = ANN_NLIST, nprobe: int = ANN_NPROBE):
+        self.store = store
+        self.requested_nlist = nlist
+        self.nprobe = nprobe
+        self.lock = threading.Lock()
+        # Centroids only change on retrain; assignments change on every upsert
+        self.centroids_path = os.path.join(store.path, "ivf_centroids.npy")
+        self.assignments_path = os.path.join(store.path, "ivf_assignments.npy")
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.lists: list[np.ndarray] = []
+        self.trained_size = 0
+        # Rows upserted while a retrain runs; they are reassigned when it lands
+        self.changed_rows: Optional[list[np.ndarray]] = None
+        self.retrain_thread: Optional[threading.Thread] = None
+
+        if os.path.exists(self.centroids_path) and os.path.exists(self.assignments_path):
+            self._load()
+        elif len(store) > 0:
+            # Training takes minutes on a large store, so it is never done on
+            # startup; queries are exact until it has been built
+            print("[ANN] No IVF index found, using exact search. Run `python ann_index.py build`.")
+
+    # Persistence
+
+    def _load(self):
+        self.centroids = np.load(self.centroids_path)
+        self.assignments = np.load(self.assignments_path)
+        # Size at training time is stored as the last element
+        self.trained_size = int(self.assignments[-1])
+        self.assignments = self.assignments[:-1]
+        self._rebuild_lists()
+        # Pick up rows added to the store while the index was not running
+        if len(self.assignments) < len(self.store):
+            self._assign_new_rows()
+
+    def save(self, centroids: bool = False):
+        if centroids:
+            self._write(self.centroids_path, self.centroids)
+        self._write(self.assignments_path, np.append(self.assignments, np.int32(self.trained_size)))
+
+    @staticmethod
+    def _write(path: str, array: np.ndarray):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as file:
+            np.save(file, array)
+        os.replace(tmp, path)
+
+    # Training and assignment
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        return normalize(np.asarray(self.store.matrix[start:stop], dtype=np.float32))
+
+    @staticmethod
+    def _nearest(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def _nearest_centroid(self, vectors: np.ndarray) -> np.ndarray:
+        return self._nearest(self.centroids, vectors)
+
+    def _fit_centroids(self, n: int, seed: int) -> np.ndarray:
+        """Spherical k-means on a sample of the first n rows of the store."""
+        nlist = min(self.requested_nlist or default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, size=min(n, nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+        sample = normalize(np.asarray(self.store.matrix[sample_rows], dtype=np.float32))
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids.astype(np.float32)
+
+    def train(self, seed: int = 0):
+        """
+        Train new centroids and reassign every row, then swap them in.
+
+        Queries and upserts keep using the current clustering meanwhile; only
+        the final swap takes the lock.
+        """
+        with self.lock:
+            n = len(self.store)
+            self.changed_rows = []
+        if n == 0:
+            self.changed_rows = None
+            return
+        start = time.perf_counter()
+        centroids = self._fit_centroids(n, seed)
+        assignments = np.concatenate(
+            [np.zeros(0, dtype=np.int32)] +
+            [self._nearest(centroids, self._rows(i, min(n, i + ASSIGN_CHUNK))) for i in range(0, n, ASSIGN_CHUNK)])
+
+        with self.lock:
+            total = len(self.store)
+            assignments = np.concatenate([assignments, np.zeros(total - n, dtype=np.int32)])
+            # Rows added or rewritten while training
+            dirty = np.unique(np.concatenate([np.arange(n, total, dtype=np.int64), *self.changed_rows]))
+            if len(dirty):
+                assignments[dirty] = self._nearest(
+                    centroids, normalize(np.asarray(self.store.matrix[dirty], dtype=np.float32)))
+            self.changed_rows = None
+            self.centroids = centroids
+            self.assignments = assignments
+            self.trained_size = n
+            self._rebuild_lists()
+            self.save(centroids=True)
+        print(f"[ANN] Trained {len(centroids)} lists on {n} vectors in {time.perf_counter() - start:.1f}s")
+
+    def _retrain_in_background(self):
+        if self.retrain_thread is not None and self.retrain_thread.is_alive():
+            return
+
+        def run():
+            try:
+                self.train()
+            except Exception as e:
+                self.changed_rows = None
+                print(f"[ANN] Retrain failed: {e}")
+
+        self.retrain_thread = threading.Thread(target=run, name="ivf-retrain", daemon=True)
+        self.retrain_thread.start()
+
+    def _assign_new_rows(self):
+        n = len(self.store)
+        done = len(self.assignments)
+        parts = [self.assignments]
+        for start in range(done, n, ASSIGN_CHUNK):
+            parts.append(self._nearest_centroid(self._rows(start, min(n, start + ASSIGN_CHUNK))))
+        self.assignments = np.concatenate(parts)
+        self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    # Pinecone-style API
+
+    def upsert(self, vectors: list[dict], namespace: str = ""):
+        result = self.store.upsert(vectors, namespace=namespace)
+        if self.centroids is None:
+            # Not built yet; queries fall back to exact search
+            return result
+        if len(self.store) > self.trained_size * ANN_RETRAIN_GROWTH:
+            # Retrain off the write path; until it lands, new vectors are
+            # assigned to the current clusters
+            self._retrain_in_background()
+
+        with self.lock:
+            # Updated vectors may have moved to a different cluster
+            rows = np.array([self.store.positions[v["id"]] for v in vectors], dtype=np.int64)
+            if self.changed_rows is not None:
+                self.changed_rows.append(rows)
+            n = len(self.store)
+            if len(self.assignments) < n:
+                self.assignments = np.concatenate(
+                    [self.assignments, np.zeros(n - len(self.assignments), dtype=np.int32)])
+            self.assignments[rows] = self._nearest_centroid(
+                normalize(np.asarray(self.store.matrix[rows], dtype=np.float32)))
+            self._rebuild_lists()
+            self.save()
+        return result
+
+    def fetch(self, ids: list[str], namespace: str = ""):
+        return self.store.fetch(ids, namespace=namespace)
+
+    def query(self, vector, top_k: int = 10, include_values: bool = False, include_metadata: bool = False,
+              namespace: str = "", nprobe: Optional[int] = None, **kwargs) -> QueryResponse:
+        with self.lock:
+            # Read both together so a retrain swap can't pair new centroids with old lists
+            centroids, lists = self.centroids, self.lists
+        if centroids is None:
+            return self.store.query(vector, top_k=top_k, include_values=include_values)
+
+        q = np.asarray(vector, dtype=np.float32)
+        probe = min(nprobe or self.nprobe, len(centroids))
+        centroid_scores = centroids @ normalize(q)
+        if probe < len(centroids):
+            nearest = np.argpartition(-centroid_scores, probe - 1)[:probe]
+        else:
+            nearest = np.arange(len(centroids))
+        candidates = np.concatenate([lists[c] for c in nearest])
+        if len(candidates) == 0:
+            return QueryResponse([])
+
+        scores = self.store.scores_for(candidates, q)
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            row = candidates[i]
+            match = {"id": self.store.ids[row], "score": float(scores[i])}
+            if include_values:
+                match["values"] = self.store.matrix[row].tolist()
+            matches.append(match)
+        return QueryResponse(matches)
+
+    def __len__(self):
+        return len(self.store)
+
+
+def recall_report(ann: IVFIndex, k: int = 50, n_queries: int = 100, nprobes=(1, 4, 8, 16, 32, 64), seed: int = 0):
+    """Print recall@k and mean latency of the ANN index against exact search."""
+    if ann.centroids is None:
+        print("No IVF index has been built yet; run `python ann_index.py build` first.")
+        return
+    store = ann.store
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(store), size=min(n_queries, len(store)), replace=False)
+    # Perturbed copies of stored vectors stand in for real query embeddings
+    queries = np.asarray(store.matrix[rows], dtype=np.float32)
+    queries = queries + rng.normal(scale=0.05 * np.abs(queries).mean(), size=queries.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    exact = [{m["id"] for m in store.query(q, top_k=k).matches} for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"exact      recall@{k}=1.000  {exact_ms:.2f} ms/query")
+
+    for nprobe in nprobes:
+        if nprobe > len(ann.centroids):
+            break
+        start = time.perf_counter()
+        found = [{m["id"] for m in ann.query(q, top_k=k, nprobe=nprobe).matches} for q in queries]
+        ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(f & e) / max(1, len(e)) for f, e in zip(found, exact)])
+        print(f"nprobe={nprobe:<4} recall@{k}={recall:.3f}  {ann_ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build", "recall"])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    store = LocalVectorIndex()
+    if args.command == "build":
+        IVFIndex(store).train()
+    else:
+        recall_report(IVFIndex(store), k=args.k, n_queries=args.queries)
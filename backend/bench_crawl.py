@@ -0,0 +1,100 @@
+# Compares crawl throughput of the old per-job setup against the shared
+# crawler worker pool.
+#
+#   python bench_crawl.py --pages 30 --concurrency 3
+#
+# "legacy" mimics the previous workers: a fresh event loop per job in each of
+# N threads and a browser start/close around every page. "pool" starts one
+# browser and crawls through N concurrent slots on a single loop.
+
+import argparse
+import asyncio
+import threading
+import time
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig
+from crawl_and_embed import crawl_and_return
+
+
+def load_urls(path: str, n: int) -> list[str]:
+    with open(path, "r") as file:
+        domains = [line.strip() for line in file if line.strip()]
+    return [f"https://{d}" for d in domains[:n]]
+
+
+def run_legacy(urls: list[str], concurrency: int) -> int:
+    pending = list(urls)
+    lock = threading.Lock()
+    ok = 0
+
+    async def crawl_one(url):
+        crawler = AsyncWebCrawler(config=BrowserConfig(verbose=False))
+        await crawler.start()
+        try:
+            return await crawl_and_return(url, crawler)
+        finally:
+            await crawler.close()
+
+    def worker():
+        nonlocal ok
+        while True:
+            with lock:
+                if not pending:
+                    return
+                url = pending.pop()
+            loop = asyncio.new_event_loop()
+            try:
+                result = loop.run_until_complete(crawl_one(url))
+                if result["images"]:
+                    with lock:
+                        ok += 1
+            finally:
+                loop.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return ok
+
+
+async def run_pool(urls: list[str], concurrency: int) -> int:
+    crawler = AsyncWebCrawler(config=BrowserConfig(verbose=False))
+    await crawler.start()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def crawl_one(url):
+        async with slots:
+            return await crawl_and_return(url, crawler)
+
+    try:
+        results = await asyncio.gather(*(crawl_one(u) for u in urls))
+    finally:
+        await crawler.close()
+    return sum(1 for r in results if r["images"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", default="domain_set.txt")
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--mode", choices=["legacy", "pool", "both"], default="both")
+    args = parser.parse_args()
+
+    urls = load_urls(args.domains, args.pages)
+    modes = ["legacy", "pool"] if args.mode == "both" else [args.mode]
+
+    for mode in modes:
+        start = time.perf_counter()
+        if mode == "legacy":
+            ok = run_legacy(urls, args.concurrency)
+        else:
+            ok = asyncio.run(run_pool(urls, args.concurrency))
+        elapsed = time.perf_counter() - start
+        print(f"[{mode}] {len(urls)} pages ({ok} ok) in {elapsed:.1f}s -> {len(urls) / elapsed:.2f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
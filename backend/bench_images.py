@@ -0,0 +1,60 @@
+# Compares image captioning + embedding throughput of the per-image loop
+# against the batched path in img_processing.py.
+#
+#   python bench_images.py --images screenshots --count 16
+#
+# "legacy" runs generate_description and make_clip_embedding once per image,
+# as the old get_image_embeddings loop did. "batched" runs embed_images, which
+# captions and embeds the images in adaptive-size batches.
+
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from img_processing import embed_images, generate_description, image_batch_size, make_clip_embedding
+
+
+def load_images(directory: str, n: int) -> list[Image.Image]:
+    names = sorted(f for f in os.listdir(directory) if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    return [Image.open(os.path.join(directory, name)).convert("RGB") for name in names[:n]]
+
+
+def run_legacy(images: list[Image.Image]) -> int:
+    embeddings = []
+    for img in images:
+        description = generate_description(img)
+        image_embeddings, text_embeddings = make_clip_embedding(img, description=description)
+        embeddings.append(np.mean([image_embeddings, text_embeddings], axis=0))
+    return len(embeddings)
+
+
+def run_batched(images: list[Image.Image]) -> int:
+    return len(embed_images(images))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default="screenshots")
+    parser.add_argument("--count", type=int, default=16)
+    parser.add_argument("--mode", choices=["legacy", "batched", "both"], default="both")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    modes = ["legacy", "batched"] if args.mode == "both" else [args.mode]
+
+    # One untimed image so model weights are resident before timing
+    run_legacy(images[:1])
+
+    for mode in modes:
+        start = time.perf_counter()
+        done = run_legacy(images) if mode == "legacy" else run_batched(images)
+        elapsed = time.perf_counter() - start
+        extra = f", batch size {image_batch_size.current()}" if mode == "batched" else ""
+        print(f"[{mode}] {done} images in {elapsed:.1f}s -> {done / elapsed:.2f} images/s{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Opt-in Arrow IPC responses.
+#
+# A client that sends "Accept: application/vnd.apache.arrow.stream" gets the
+# result rows as one record batch of column arrays instead of a JSON list of
+# objects. String columns (domains, ids) are dictionary-encoded, so each
+# distinct string is sent once in a string table and rows carry int32
+# references. The remaining top-level fields of the JSON response (status,
+# query, page, ...) go in the schema metadata under "response".
+#
+# Every Arrow response carries X-Body-Bytes and X-Serialize-Ms headers.
+# Every COMPARE_EVERY-th one is also serialized as JSON, so FormatStats
+# reports the size and time saved against the JSON it replaces.
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+RESPONSE_METADATA_KEY = b"response"
+COMPARE_EVERY = 20
+
+
+def wants_arrow(request: Request) -> bool:
+    return ARROW_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def rows_to_table(rows: list[dict]):
+    """Column table from a list of flat dicts, with string columns dictionary-encoded."""
+    import pyarrow as pa
+
+    names = list(dict.fromkeys(name for row in rows for name in row))
+    arrays = {}
+    for name in names:
+        array = pa.array([row.get(name) for row in rows])
+        if pa.types.is_string(array.type):
+            array = array.dictionary_encode()
+        arrays[name] = array
+    return pa.table(arrays)
+
+
+def columns_to_table(columns: dict):
+    """Column table from already columnar data (lists, numpy or Arrow arrays)."""
+    import pyarrow as pa
+
+    arrays = {}
+    for name, values in columns.items():
+        array = values if isinstance(values, (pa.Array, pa.ChunkedArray)) else pa.array(values)
+        if pa.types.is_string(array.type):
+            array = array.dictionary_encode()
+        arrays[name] = array
+    return pa.table(arrays)
+
+
+def arrow_body(table, meta: Optional[dict] = None) -> bytes:
+    import pyarrow as pa
+
+    if meta:
+        table = table.replace_schema_metadata({RESPONSE_METADATA_KEY: json.dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class FormatStats:
+    def __init__(self, compare_every: int = COMPARE_EVERY):
+        self.compare_every = compare_every
+        self.lock = threading.Lock()
+        self.endpoints: dict[str, dict] = {}
+
+    def record(self, endpoint: str, arrow_bytes: int, arrow_ms: float, content_builder=None):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                "responses": 0, "arrow_bytes": 0, "arrow_ms": 0.0,
+                "compared": 0, "compared_arrow_bytes": 0, "compared_arrow_ms": 0.0,
+                "compared_json_bytes": 0, "compared_json_ms": 0.0,
+            })
+            stats["responses"] += 1
+            stats["arrow_bytes"] += arrow_bytes
+            stats["arrow_ms"] += arrow_ms
+            compare = content_builder is not None and stats["responses"] % self.compare_every == 1
+        if not compare:
+            return
+
+        start = time.perf_counter()
+        json_bytes = len(json.dumps(content_builder()).encode("utf-8"))
+        json_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            stats["compared"] += 1
+            stats["compared_arrow_bytes"] += arrow_bytes
+            stats["compared_arrow_ms"] += arrow_ms
+            stats["compared_json_bytes"] += json_bytes
+            stats["compared_json_ms"] += json_ms
+
+    def report(self) -> dict:
+        with self.lock:
+            report = {}
+            for endpoint, s in self.endpoints.items():
+                entry = {
+                    "responses": s["responses"],
+                    "avg_arrow_bytes": s["arrow_bytes"] // s["responses"],
+                    "avg_arrow_ms": round(s["arrow_ms"] / s["responses"], 3),
+                    "compared_with_json": s["compared"],
+                }
+                if s["compared"]:
+                    entry["size_ratio_vs_json"] = round(s["compared_arrow_bytes"] / max(1, s["compared_json_bytes"]), 3)
+                    entry["bytes_saved_per_response"] = (s["compared_json_bytes"] - s["compared_arrow_bytes"]) // s["compared"]
+                    entry["ms_saved_per_response"] = round((s["compared_json_ms"] - s["compared_arrow_ms"]) / s["compared"], 3)
+                report[endpoint] = entry
+            return report
+
+
+format_stats = FormatStats()
+
+
+def arrow_response(endpoint: str, table, meta: Optional[dict] = None, json_content=None,
+                   started: Optional[float] = None) -> Response:
+    """
+    Serialize table as an Arrow IPC stream. json_content, a callable giving
+    the equivalent JSON body, is only called for sampled size comparisons.
+    started lets the caller include building the table in the timing.
+    """
+    start = started if started is not None else time.perf_counter()
+    body = arrow_body(table, meta)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    format_stats.record(endpoint, len(body), elapsed_ms, json_content)
+    return Response(
+        content=body,
+        media_type=ARROW_MEDIA_TYPE,
+        headers={"X-Body-Bytes": str(len(body)), "X-Serialize-Ms": f"{elapsed_ms:.3f}"}
+    )
@@ -0,0 +1,95 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional
+
+import numpy as np
+import xxhash
+from PIL.Image import Image
+
+# Cache of Gemini output keyed by a fingerprint of the crawled page.
+#
+# If a site's visible content has not changed since the last crawl, its
+# description and embedding are reused and no Gemini calls are made.
+
+CONTENT_CACHE_PATH = os.getenv("CONTENT_CACHE_PATH", "content_cache.db")
+
+# Screenshots are hashed from a small grayscale thumbnail so that encoder
+# noise and sub-pixel rendering differences don't change the fingerprint
+THUMBNAIL_SIZE = (64, 64)
+
+WHITESPACE = re.compile(r"\s+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content (
+    fingerprint TEXT PRIMARY KEY,
+    description TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(" ", text or "").strip()
+
+
+def image_hash(img: Image) -> str:
+    thumb = img.convert("L").resize(THUMBNAIL_SIZE)
+    # Quantize to 16 gray levels before hashing
+    pixels = np.asarray(thumb, dtype=np.uint8) >> 4
+    return xxhash.xxh3_64_hexdigest(pixels.tobytes())
+
+
+def fingerprint(text: str, images: list[Image]) -> str:
+    """xxh3-128 over the normalized page text and the screenshot hashes."""
+    h = xxhash.xxh3_128()
+    h.update(normalize_text(text).encode("utf-8"))
+    for img in images:
+        h.update(b"\0")
+        h.update(image_hash(img).encode("ascii"))
+    return h.hexdigest()
+
+
+class ContentCache:
+    def __init__(self, path: str = CONTENT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key: str) -> Optional[tuple[str, list[float]]]:
+        """Returns (description, embedding) for a fingerprint, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT description, embedding FROM content WHERE fingerprint = ?", (key,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0], np.frombuffer(row[1], dtype=np.float32).tolist()
+
+    def put(self, key: str, description: str, embedding: list[float]):
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content (fingerprint, description, embedding, updated_at) VALUES (?, ?, ?, ?)",
+                (key, description, blob, time.time())
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
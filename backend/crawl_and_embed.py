@@ -1,6 +1,8 @@
 import asyncio
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, BrowserConfig
 from PIL import Image
+from content_cache import fingerprint
+from html_text import visible_text
 import io
 
 
@@ -13,40 +15,48 @@ run_config = CrawlerRunConfig(
     screenshot=True
 ) 
 
+def page_fingerprint(html_content: str, screenshot: Image.Image) -> str:
+    # Visible text only: scripts, nonces and tracking attributes change on
+    # every load and would make every fingerprint unique
+    return fingerprint(visible_text(html_content), [screenshot])
+
+
 async def crawl_and_return(url: str, crawler):
     """
     Crawls a page and returns its content and a screenshot
-    as a list of PIL images using crawl4ai.
+    as a list of PIL images using crawl4ai, plus a content
+    fingerprint used to skip re-describing unchanged pages.
+
+    The crawler must already be started; it is shared between concurrent
+    callers, so starting and closing it is left to the owner.
     """
-    # Initialize the AsyncWebCrawler
-    
     try:
         # Crawl the URL
-        await crawler.start()
         result = await crawler.arun(url, config=run_config)
         html_content = result.html
         screenshot = result.screenshot
-        print(html_content)
         if not screenshot:
             print("[crawl error] screenshot could not be taken")
             return {
                 "url": url,
                 "text": "",
-                "images": []
+                "images": [],
+                "error": "screenshot could not be taken"
             }
         screenshot_bytes = io.BytesIO(screenshot)
         pil_image = Image.open(screenshot_bytes)
+        pil_image.load()
         return {
             "url": url,
             "text": html_content,
-            "images": [pil_image]
+            "images": [pil_image],
+            "fingerprint": await asyncio.to_thread(page_fingerprint, html_content, pil_image)
         }
     except Exception as e:
         print(f"[crawl error] {url} | {e}")
         return {
             "url": url,
             "text": "",
-            "images": []
+            "images": [],
+            "error": str(e)
         }
-    finally:
-        await crawler.close()
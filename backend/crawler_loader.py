@@ -1,7 +1,8 @@
 import asyncio
 from crawl4ai import AsyncWebCrawler
 from img_processing import get_image_embeddings_for_urls
-from text_processing import get_text_embeddings
+from text_processing import embed_texts, text_embedding_version
+from html_text import visible_text
 import numpy as np
 from pinecone import Pinecone
 import os
@@ -9,10 +10,21 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Sites whose texts go through one embed_texts call, so their token windows
+# share batched forward passes
+SITE_BATCH_SIZE = 8
+
 pc = Pinecone(api_key=os.getenv("PINECONE_KEY"))
 index = pc.Index(host=os.getenv("PINECONE_INDEX_HOST"))
 
+def is_current(website_url: str, version: str) -> bool:
+    """Whether the stored vector was made with the current text embedding version."""
+    vector = index.fetch(ids=[website_url]).vectors.get(website_url)
+    return vector is not None and (vector.metadata or {}).get("text_embedding_version") == version
+
 async def main():
+    version = text_embedding_version()
+    print(f"Text embedding version: {version}")
 
     # website_url = 'https://crawl4ai.com'
 
@@ -21,38 +33,52 @@ async def main():
     with open(website_url_csv, 'r') as file:
         website_urls = file.readlines()
 
+    batch = []
     for website_url in website_urls:
         website_url = website_url.strip()  # Remove any extra whitespace
 
+        # Only re-embed when the stored vector came from another version
+        if is_current(website_url, version):
+            continue
+
         # Create an instance of AsyncWebCrawler
         async with AsyncWebCrawler() as crawler:
             # Run the crawler on a URL
             result = await crawler.arun(url=website_url)
 
-        # Print the extracted content
-        text = result.html
-
-        # print(result.html)
+        # Embed what a visitor reads rather than the raw markup
+        text = visible_text(result.html)
 
         image_urls = [i['src'] for i in result.media['images']]
 
         print(image_urls)
 
         img_embed = await get_image_embeddings_for_urls(image_urls)
-        text_embed = get_text_embeddings(text)
+        batch.append((website_url, text, img_embed))
 
+        if len(batch) >= SITE_BATCH_SIZE:
+            upsert_sites(batch, version)
+            batch = []
+
+    if batch:
+        upsert_sites(batch, version)
+
+def upsert_sites(batch, version: str):
+    text_embeds = embed_texts([text for _, text, _ in batch])
+
+    vectors = []
+    for (website_url, _, img_embed), text_embed in zip(batch, text_embeds):
         if img_embed:
             final_embedding = np.mean([img_embed, text_embed], axis=0)  # Average the embeddings
         else:
             final_embedding = text_embed
-        
-        index.upsert(
-            vectors=[{
-                "id": website_url,
-                "values": list(final_embedding),
-            }],
-            namespace=""
-        )
+        vectors.append({
+            "id": website_url,
+            "values": [float(v) for v in final_embedding],
+            "metadata": {"text_embedding_version": version},
+        })
+
+    index.upsert(vectors=vectors, namespace="")
 
 # Run the async main function
 asyncio.run(main())
@@ -0,0 +1,86 @@
+import fcntl
+import os
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+
+# Persistent domain dictionary: every domain gets a stable int32 id.
+#
+# The dictionary file is domain_ids.txt, one domain per line, and a domain's
+# id is its position in the file. It is kept apart from domain_set.txt, the
+# tracked crawl list, because it grows with every domain the server sees. The
+# file is only ever appended to, so ids never change once assigned. New
+# domains are appended under flock after catching up with lines other
+# processes (edge_loader.py, other workers) have added, so every process hands
+# out the same id for the same domain.
+
+DOMAIN_DICT_PATH = os.getenv("DOMAIN_DICT_PATH", "domain_ids.txt")
+
+UNKNOWN_ID = -1
+
+
+class DomainDictionary:
+    def __init__(self, path: str = DOMAIN_DICT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        # Append-only, so readers may index it without taking the lock
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.file_offset = 0
+        with self.lock:
+            self._read_new_lines()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _read_new_lines(self):
+        """Pick up whole lines appended to the file since the last read."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            file.seek(self.file_offset)
+            data = file.read()
+        end = data.rfind(b"\n") + 1
+        for name in data[:end].decode("utf-8").splitlines():
+            if name and name not in self.ids:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+        self.file_offset += end
+
+    def intern_many(self, domains: Iterable[str]) -> np.ndarray:
+        """Ids for the given domains, assigning and persisting ids for new ones."""
+        domains = list(domains)
+        with self.lock:
+            missing = [d for d in dict.fromkeys(domains) if d not in self.ids]
+            if missing:
+                with open(self.path, "ab") as file:
+                    fcntl.flock(file, fcntl.LOCK_EX)
+                    self._read_new_lines()
+                    missing = [d for d in missing if d not in self.ids]
+                    if missing:
+                        data = "".join(d + "\n" for d in missing).encode("utf-8")
+                        file.write(data)
+                        file.flush()
+                        for d in missing:
+                            self.ids[d] = len(self.names)
+                            self.names.append(d)
+                        self.file_offset += len(data)
+            return np.array([self.ids[d] for d in domains], dtype=np.int32)
+
+    def intern(self, domain: str) -> int:
+        return int(self.intern_many([domain])[0])
+
+    def lookup_many(self, domains: Iterable[str]) -> np.ndarray:
+        """Ids for the given domains without assigning new ones (UNKNOWN_ID if absent)."""
+        return np.array([self.ids.get(d, UNKNOWN_ID) for d in domains], dtype=np.int32)
+
+    def lookup(self, domain: str) -> Optional[int]:
+        return self.ids.get(domain)
+
+    def name(self, domain_id: int) -> str:
+        return self.names[domain_id]
+
+    def names_of(self, domain_ids: Iterable[int]) -> list[str]:
+        names = self.names
+        return [names[i] for i in domain_ids]
@@ -0,0 +1,232 @@
+import threading
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from domain_dict import DomainDictionary
+
+# In-process graph of browsing_complete edges.
+#
+# Edges are held column-wise in NumPy arrays, with domains stored as int32 ids
+# from the shared domain dictionary (domain_dict.py). Two indexes are built over them:
+#   - CSR by origin: rows sorted by (origin, target) with an indptr array, so
+#     the out-edges of a site are one contiguous slice
+#   - by user: rows sorted by (user, order) with a per-user row range
+# Site-pair counts, single-pair lookups and per-user edge lists are answered
+# from these without a database round trip. New rows are appended with
+# add_edges(), or page by page with page_columns() and one add_columns() call,
+# which builds a fresh snapshot and swaps it in.
+
+class EdgeSnapshot:
+    def __init__(self, dictionary: DomainDictionary, columns: dict[str, np.ndarray]):
+        self.dictionary = dictionary
+        # The dictionary can grow after this snapshot is built; ids at or past
+        # n_domains have no edges here
+        self.n_domains = n_domains = len(dictionary)
+        self.columns = columns
+        origin, target, user, order = columns["origin"], columns["target"], columns["user"], columns["order"]
+
+        # CSR by origin
+        self.by_origin = np.lexsort((target, origin))
+        counts = np.bincount(origin, minlength=n_domains)
+        self.indptr = np.zeros(n_domains + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+
+        # Secondary index by user, in (user, order, id) order so it doubles as
+        # the cursor order used by the paged endpoints
+        self.by_user = np.lexsort((columns["id"], order, user))
+        sorted_users = user[self.by_user]
+        self.sorted_users = sorted_users
+        self.sorted_orders = order[self.by_user]
+        self.sorted_ids = columns["id"][self.by_user]
+        self.user_ranges: dict[int, tuple[int, int]] = {}
+        if len(sorted_users):
+            starts = np.flatnonzero(np.r_[True, sorted_users[1:] != sorted_users[:-1]])
+            ends = np.r_[starts[1:], len(sorted_users)]
+            self.user_ranges = {int(sorted_users[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def site_id(self, website: str) -> Optional[int]:
+        i = self.dictionary.lookup(website)
+        return i if i is not None and i < self.n_domains else None
+
+    def site_ids(self, websites: Iterable[str]) -> np.ndarray:
+        ids = np.unique(self.dictionary.lookup_many(websites))
+        return ids[(ids >= 0) & (ids < self.n_domains)]
+
+    def out_rows(self, origins: np.ndarray) -> np.ndarray:
+        """Row numbers of every edge leaving the given origin ids."""
+        if len(origins) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.by_origin[self.indptr[o]:self.indptr[o + 1]] for o in origins])
+
+    def position_after(self, key: tuple[int, int, int]) -> int:
+        """Index into by_user of the first row whose (user, order, id) is greater than key."""
+        user, order, edge_id = key
+        lo = int(np.searchsorted(self.sorted_users, user, "left"))
+        hi = int(np.searchsorted(self.sorted_users, user, "right"))
+        orders = self.sorted_orders[lo:hi]
+        hi = lo + int(np.searchsorted(orders, order, "right"))
+        lo = lo + int(np.searchsorted(orders, order, "left"))
+        return lo + int(np.searchsorted(self.sorted_ids[lo:hi], edge_id, "right"))
+
+    def row(self, i: int) -> dict:
+        c = self.columns
+        names = self.dictionary.names
+        return {
+            "id": int(c["id"][i]),
+            "origin": names[c["origin"][i]],
+            "target": names[c["target"][i]],
+            "user": int(c["user"][i]),
+            "order": int(c["order"][i]),
+            "origin_start": c["origin_start"][i],
+            "time_active": int(c["time_active"][i]),
+            "switch_time": c["switch_time"][i],
+        }
+
+
+def empty_columns() -> dict[str, np.ndarray]:
+    return {
+        "id": np.zeros(0, dtype=np.int64),
+        "origin": np.zeros(0, dtype=np.int32),
+        "target": np.zeros(0, dtype=np.int32),
+        "user": np.zeros(0, dtype=np.int32),
+        "order": np.zeros(0, dtype=np.int32),
+        "origin_start": np.zeros(0, dtype=object),
+        "time_active": np.zeros(0, dtype=np.int32),
+        "switch_time": np.zeros(0, dtype=object),
+    }
+
+
+class EdgeGraph:
+    def __init__(self, dictionary: DomainDictionary):
+        self.lock = threading.Lock()
+        self.dictionary = dictionary
+        self.snapshot = EdgeSnapshot(dictionary, empty_columns())
+        self.last_id = 0
+        # Bumped on every change so caches keyed on the data can be invalidated
+        self.version = 0
+
+    def page_columns(self, rows: list[dict]) -> dict[str, np.ndarray]:
+        """Column arrays for one page of edge rows, ready for add_columns()."""
+        time_active = [r.get("time_active") for r in rows]
+        return {
+            "id": np.array([r["id"] for r in rows], dtype=np.int64),
+            "origin": self.dictionary.intern_many(r["origin"] for r in rows),
+            "target": self.dictionary.intern_many(r["target"] for r in rows),
+            "user": np.array([r["user"] for r in rows], dtype=np.int32),
+            "order": np.array([r.get("order") or 0 for r in rows], dtype=np.int32),
+            "origin_start": np.array([r.get("origin_start") for r in rows], dtype=object),
+            "time_active": np.array([t if isinstance(t, (int, float)) else 0 for t in time_active], dtype=np.int32),
+            "switch_time": np.array([r.get("switch_time") for r in rows], dtype=object),
+        }
+
+    def add_columns(self, pages: list[dict[str, np.ndarray]]):
+        """Append pages from page_columns() with a single snapshot rebuild."""
+        pages = [page for page in pages if len(page["id"])]
+        if not pages:
+            return
+        with self.lock:
+            old = self.snapshot
+            columns = {name: np.concatenate([old.columns[name]] + [page[name] for page in pages]) for name in old.columns}
+            self.snapshot = EdgeSnapshot(self.dictionary, columns)
+            self.last_id = max(self.last_id, max(int(page["id"].max()) for page in pages))
+            self.version += 1
+
+    def add_edges(self, rows: list[dict]):
+        if rows:
+            self.add_columns([self.page_columns(rows)])
+
+    def pair_counts(self, websites: list[str], users: list[int]) -> list[dict]:
+        """
+        Transitions between the given sites, restricted to the given users.
+        One row per (origin, target) with the number of transitions and the
+        number of distinct users who made them, most frequent first.
+        """
+        snap = self.snapshot
+        sites = snap.site_ids(websites)
+        rows = snap.out_rows(sites)
+        if len(rows) == 0:
+            return []
+        c = snap.columns
+        mask = np.isin(c["target"][rows], sites) & np.isin(c["user"][rows], users)
+        rows = rows[mask]
+        if len(rows) == 0:
+            return []
+
+        n = np.int64(snap.n_domains)
+        pair = c["origin"][rows].astype(np.int64) * n + c["target"][rows]
+        pairs, counts = np.unique(pair, return_counts=True)
+        user_pairs = np.unique(np.stack([pair, c["user"][rows].astype(np.int64)]), axis=1)[0]
+        _, user_counts = np.unique(user_pairs, return_counts=True)
+
+        order = np.argsort(-counts, kind="stable")
+        names = self.dictionary.names
+        return [
+            {
+                "origin": names[int(pairs[i] // n)],
+                "target": names[int(pairs[i] % n)],
+                "count": int(counts[i]),
+                "user_count": int(user_counts[i]),
+            }
+            for i in order
+        ]
+
+    def pair_records(self, origin: str, target: str, users: list[int]) -> list[dict]:
+        """Per-user number of transitions from origin to target."""
+        snap = self.snapshot
+        o = snap.site_id(origin)
+        t = snap.site_id(target)
+        if o is None or t is None:
+            return []
+        c = snap.columns
+        out = snap.by_origin[snap.indptr[o]:snap.indptr[o + 1]]
+        # Out-edges are sorted by target, so the pair is a sub-slice
+        targets = c["target"][out]
+        out = out[np.searchsorted(targets, t, "left"):np.searchsorted(targets, t, "right")]
+        out = out[np.isin(c["user"][out], users)]
+        found_users, counts = np.unique(c["user"][out], return_counts=True)
+        return [{"user": int(u), "count": int(n)} for u, n in zip(found_users, counts)]
+
+    def iter_user_edges(self, user: int, offset: int = 0, limit: Optional[int] = None) -> Iterator[dict]:
+        """A user's edges in browsing order, built one row at a time."""
+        snap = self.snapshot
+        bounds = snap.user_ranges.get(user)
+        if bounds is None:
+            return
+        start, end = bounds
+        start = min(end, start + offset)
+        if limit is not None:
+            end = min(end, start + limit)
+        for i in snap.by_user[start:end]:
+            yield snap.row(i)
+
+    def user_edges(self, user: int, offset: int = 0, limit: Optional[int] = None) -> list[dict]:
+        return list(self.iter_user_edges(user, offset, limit))
+
+    def edges_after(self, after: Optional[tuple[int, int, int]], limit: int,
+                    user: Optional[int] = None) -> list[dict]:
+        """
+        Up to limit edges in (user, order, id) order, strictly after the given
+        key, optionally for a single user. Mirrors edge_source.fetch_edges_after.
+        """
+        snap = self.snapshot
+        start, end = 0, len(snap)
+        if user is not None:
+            start, end = snap.user_ranges.get(user, (0, 0))
+        if after is not None:
+            start = max(start, snap.position_after(after))
+        end = min(end, start + limit)
+        return [snap.row(i) for i in snap.by_user[start:end]]
+
+    def stats(self) -> dict:
+        snap = self.snapshot
+        return {
+            "edges": len(snap),
+            "domains": snap.n_domains,
+            "users": len(snap.user_ranges),
+            "last_id": self.last_id,
+            "version": self.version,
+        }
@@ -1,4 +1,16 @@
-import csv, os
+import argparse
+import csv
+import heapq
+import math
+import os
+import resource
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from domain_dict import DomainDictionary
 # from supabase import create_client, Client
 # from dotenv import load_dotenv
 # from tqdm import tqdm
@@ -29,62 +41,224 @@ import csv, os
 #     "switch_time": "TIMESTAMP",
 # }
 
-if __name__ == "__main__":
-    # if not check_table_exists("browsing", BROWSING_SCHEMA):
-    #     print("Table doesn't exist")
-    #     exit(1)
+# Streaming, bounded-memory conversion of browsing.csv into edge rows.
+#
+#   1. Rows are streamed from the export and appended to one of N shard files
+#      by user, so each user's records end up in a single shard. Domains are
+#      interned into the persistent domain dictionary (domain_dict.py) on the
+#      way, and shards carry the int32 ids rather than the strings
+#   2. Shards are sorted in parallel worker processes. A shard larger than the
+#      per-worker memory budget is sorted in runs that are spilled to disk and
+#      merged with heapq.merge, so no worker ever holds more than its budget
+#   3. Each worker walks its sorted shard and writes the deduplicated
+#      transitions (consecutive visits to the same domain are skipped) to a
+#      part file; the parts are concatenated into the output with ids, and
+#      domain ids are turned back into names only at that point
+#
+# The shard count is raised automatically so that a shard is expected to fit
+# in one worker's share of --max-memory-mb, but never past the open-file limit
+# (every shard file is open during the split).
 
-    # # clear table
-    # SUPABASE.table("browsing").delete().eq("user", 1421).execute()
+INPUT_PATH = "./backend/browsing.csv"
+OUTPUT_PATH = "./backend/browsing_processed_2.csv"
+DOMAINS_PATH = "./backend/domain_ids.txt"
 
-    domain_set = set()
+OUTPUT_HEADER = ["id", "origin", "target", "user", "order", "origin_start", "time_active", "switch_time"]
 
-    panelists: dict[str, list[tuple[str, str, int]]] = {}
+# Rough in-memory cost of one parsed record, used to size sort runs
+RECORD_BYTES = 256
+PROGRESS_EVERY = 100000
+# Rows buffered per batch of dictionary lookups
+INTERN_BATCH = 10000
+# File descriptors left free for the input, the dictionary and the interpreter
+OPEN_FILE_HEADROOM = 64
 
-    with open('./backend/browsing.csv', 'r') as file:
-        reader = csv.reader(file)
-        next(reader) # Skip the header row
-        for i, row in enumerate(reader):
 
-            if i % 100000 == 0:
-                print(f"Processed {i} rows")
+def max_open_shards() -> int:
+    """Most shard files the split can hold open at once under RLIMIT_NOFILE."""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return 4096
+    return max(1, soft - OPEN_FILE_HEADROOM)
 
-            # process row
-            user = row[2]
-            domain = row[-1] + row[-2]
-            timestamp = row[-4]
-            active_seconds = int(row[-3])
 
-            # for our records
-            domain_set.add(domain)
+def shard_of(user: str, shards: int) -> int:
+    return zlib.crc32(user.encode()) % shards
+
+
+def split_into_shards(input_path: str, shard_dir: str, shards: int, dictionary: DomainDictionary) -> int:
+    """Stream the export into shard files of (user, timestamp, seq, domain_id, active_seconds)."""
+    files = [open(os.path.join(shard_dir, f"shard_{i}.csv"), "w", newline="") for i in range(shards)]
+    writers = [csv.writer(f) for f in files]
+    start = time.perf_counter()
+    rows = 0
+    batch = []
+
+    def write_batch():
+        domain_ids = dictionary.intern_many(record[3] for record in batch)
+        for (user, timestamp, seq, _, active_seconds), domain_id in zip(batch, domain_ids.tolist()):
+            writers[shard_of(user, shards)].writerow((user, timestamp, seq, domain_id, active_seconds))
+        batch.clear()
+
+    try:
+        with open(input_path, "r", newline="") as file:
+            reader = csv.reader(file)
+            next(reader) # Skip the header row
+            for rows, row in enumerate(reader, start=1):
+                user = row[2]
+                domain = row[-1] + row[-2]
+                timestamp = row[-4]
+                active_seconds = row[-3]
+
+                # seq keeps the sort stable for records with equal timestamps
+                batch.append((user, timestamp, rows, domain, active_seconds))
+                if len(batch) >= INTERN_BATCH:
+                    write_batch()
+
+                if rows % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"[Split] {rows} rows ({rows / elapsed:.0f} rows/s)")
+            write_batch()
+    finally:
+        for f in files:
+            f.close()
+    return rows
+
+
+def read_records(path: str):
+    with open(path, "r", newline="") as file:
+        for user, timestamp, seq, domain_id, active_seconds in csv.reader(file):
+            yield user, timestamp, int(seq), int(domain_id), active_seconds
 
-            if user not in panelists: # first time
-                panelists[user] = [(domain, timestamp, active_seconds)]
-                continue
-            panelists[user].append((domain, timestamp, active_seconds))
 
-    csv_rows = []
+def sorted_records(path: str, run_rows: int):
+    """Records of a shard in (user, timestamp, seq) order, spilling sorted runs past run_rows."""
+    runs = []
+    chunk = []
+    for record in read_records(path):
+        chunk.append(record)
+        if len(chunk) >= run_rows:
+            chunk.sort()
+            run_path = f"{path}.run{len(runs)}"
+            with open(run_path, "w", newline="") as run:
+                csv.writer(run).writerows(chunk)
+            runs.append(run_path)
+            chunk = []
+    chunk.sort()
+    if not runs:
+        yield from chunk
+        return
+    try:
+        yield from heapq.merge(chunk, *(read_records(r) for r in runs))
+    finally:
+        for r in runs:
+            os.remove(r)
 
-    for user in panelists.keys():
-        panelists[user] = sorted(panelists[user], key=lambda x: x[-2])
 
-        l_domain = panelists[user][0][0]
-        l_timestamp = panelists[user][0][1]
-        l_active_seconds = panelists[user][0][2]
-        for i, (domain, timestamp, active_seconds) in enumerate(panelists[user][1:]):
+def process_shard(path: str, out_path: str, run_rows: int) -> tuple[int, int]:
+    """Sort one shard and write its transitions. Returns (records, transitions)."""
+    records = 0
+    transitions = 0
+    with open(out_path, "w", newline="") as out:
+        writer = csv.writer(out)
+        last = None
+        i = 0
+        for user, timestamp, _, domain, active_seconds in sorted_records(path, run_rows):
+            records += 1
+            if last is None or last[0] != user:
+                last = (user, domain, timestamp, active_seconds)
+                i = 0
+                continue
+            _, l_domain, l_timestamp, l_active_seconds = last
+            order = i
+            i += 1
             if l_domain == domain:
                 continue
+            writer.writerow((l_domain, domain, user, order, l_timestamp, int(l_active_seconds), timestamp))
+            transitions += 1
+            last = (user, domain, timestamp, active_seconds)
+    os.remove(path)
+    return records, transitions
+
+
+def load_edges(input_path: str = INPUT_PATH, output_path: str = OUTPUT_PATH, domains_path: str = DOMAINS_PATH,
+               shards: int = 64, workers: int = os.cpu_count() or 1, max_memory_mb: int = 1024):
+    workers = max(1, workers)
+    budget = max_memory_mb * 1024 * 1024 // workers
+    # Enough shards that the average one fits a worker's budget
+    input_bytes = os.path.getsize(input_path)
+    shards = max(shards, math.ceil(input_bytes * 2 / budget))
+    # Every shard file is open during the split. Past the open-file limit,
+    # shards just get bigger; an oversized shard is sorted in spilled runs.
+    shards = min(shards, max_open_shards())
+    run_rows = max(1000, budget // RECORD_BYTES)
+    print(f"[Edges] {input_bytes / 1e6:.0f} MB input, {shards} shards, {workers} workers, "
+          f"{max_memory_mb} MB budget ({run_rows} records per sort run)")
+
+    start = time.perf_counter()
+    dictionary = DomainDictionary(domains_path)
+    work_dir = tempfile.mkdtemp(prefix="edge_loader_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        rows = split_into_shards(input_path, work_dir, shards, dictionary)
+        split_elapsed = time.perf_counter() - start
+        print(f"[Split] {rows} rows into {shards} shards in {split_elapsed:.1f}s")
+
+        parts = [os.path.join(work_dir, f"part_{i}.csv") for i in range(shards)]
+        done = 0
+        records = 0
+        transitions = 0
+        sort_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(process_shard, os.path.join(work_dir, f"shard_{i}.csv"), parts[i], run_rows)
+                for i in range(shards)
+            ]
+            for future in as_completed(futures):
+                shard_records, shard_transitions = future.result()
+                done += 1
+                records += shard_records
+                transitions += shard_transitions
+                elapsed = time.perf_counter() - sort_start
+                print(f"[Sort] {done}/{shards} shards, {records} records ({records / elapsed:.0f} records/s), "
+                      f"{transitions} transitions")
+
+        # Concatenate the parts, numbering rows as they are copied
+        with open(output_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(OUTPUT_HEADER)
+            edge_id = 0
+            for part in parts:
+                with open(part, "r", newline="") as part_file:
+                    for origin, target, *rest in csv.reader(part_file):
+                        edge_id += 1
+                        writer.writerow((edge_id, dictionary.name(int(origin)), dictionary.name(int(target)), *rest))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"[Edges] {rows} rows -> {transitions} edges in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s), "
+          f"{len(dictionary)} domains in {domains_path}")
+
 
-            csv_rows.append((l_domain, domain, user, i, l_timestamp, l_active_seconds, timestamp))
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--domains", default=DOMAINS_PATH)
+    parser.add_argument("--shards", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-memory-mb", type=int, default=1024)
+    args = parser.parse_args()
 
-            l_domain = domain
-            l_timestamp = timestamp
-            l_active_seconds = active_seconds
+    load_edges(args.input, args.output, args.domains, args.shards, args.workers, args.max_memory_mb)
 
-    with open('./backend/browsing_processed_2.csv', 'w') as file:
-        writer = csv.writer(file)
-        writer.writerow(["id", "origin", "target", "user", "order", "origin_start", "time_active", "switch_time"])
-        writer.writerows([(i, *row) for i, row in enumerate(csv_rows, start=1)])
 
-    with open('./backend/domain_set.txt', 'w') as file:
-        file.writelines([d + '\n' for d in domain_set])
\ No newline at end of file
+if __name__ == "__main__":
+    # if not check_table_exists("browsing", BROWSING_SCHEMA):
+    #     print("Table doesn't exist")
+    #     exit(1)
+
+    # # clear table
+    # SUPABASE.table("browsing").delete().eq("user", 1421).execute()
+
+    main()
@@ -0,0 +1,104 @@
+import base64
+import json
+from typing import Iterator, Optional
+
+# Incremental reader for the browsing_complete table.
+#
+# Rows are read in id order with a `gt("id", last_id)` filter rather than an
+# offset, so every page costs the same and a later call can pick up only the
+# rows inserted since the previous one.
+#
+# Client-facing pages use the same idea with an opaque cursor holding the
+# (user, order, id) of the last row returned; the next page starts strictly
+# after it, so deep pages are as cheap as the first and rows inserted during
+# a scan cannot shift later pages.
+
+EDGE_TABLE = "browsing_complete"
+EDGE_COLUMNS = "id,origin,target,user,order,origin_start,time_active,switch_time"
+EDGE_PAGE_SIZE = 1000
+
+
+def iter_edge_pages(supabase, after_id: int = 0, page_size: int = EDGE_PAGE_SIZE,
+                    columns: str = EDGE_COLUMNS, user: Optional[int] = None) -> Iterator[list[dict]]:
+    """Yield pages of edge rows with id > after_id, in id order, optionally for one user."""
+    last_id = after_id
+    while True:
+        query = supabase.table(EDGE_TABLE).select(columns)
+        if user is not None:
+            query = query.eq("user", user)
+        result = query\
+            .gt("id", last_id)\
+            .order("id")\
+            .limit(page_size)\
+            .execute()
+        if not result.data:
+            return
+        yield result.data
+        last_id = result.data[-1]["id"]
+        if len(result.data) < page_size:
+            return
+
+
+def iter_rpc_pages(supabase, function: str, params: dict,
+                   page_size: int = EDGE_PAGE_SIZE) -> Iterator[list[dict]]:
+    """Yield pages of an RPC's result until a short page comes back."""
+    offset = 0
+    while True:
+        result = supabase.rpc(function, params).range(offset, offset + page_size - 1).execute()
+        if not result.data:
+            return
+        yield result.data
+        if len(result.data) < page_size:
+            return
+        offset += page_size
+
+
+EdgeKey = tuple[int, int, int]
+
+
+def encode_cursor(key: EdgeKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> EdgeKey:
+    """Inverse of encode_cursor. Raises ValueError on a malformed token."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        user, order, edge_id = (int(v) for v in key)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return user, order, edge_id
+
+
+def edge_key(row: dict) -> EdgeKey:
+    return row["user"], row.get("order") or 0, row["id"]
+
+
+def fetch_edges_after(supabase, after: Optional[EdgeKey], page_size: int = EDGE_PAGE_SIZE,
+                      user: Optional[int] = None, columns: str = "*") -> list[dict]:
+    """
+    One page of edges in (user, order, id) order, starting after the given
+    key. With user set, only that user's edges are returned.
+    """
+    query = supabase.table(EDGE_TABLE).select(columns)
+    if user is not None:
+        query = query.eq("user", user)
+    if after is not None:
+        u, o, i = after
+        if user is not None:
+            query = query.or_(f"order.gt.{o},and(order.eq.{o},id.gt.{i})")
+        else:
+            query = query.or_(f"user.gt.{u},and(user.eq.{u},order.gt.{o}),and(user.eq.{u},order.eq.{o},id.gt.{i})")
+    return query\
+        .order("user")\
+        .order("order")\
+        .order("id")\
+        .limit(page_size)\
+        .execute().data
+
+
+def count_edges(supabase, user: Optional[int] = None) -> int:
+    query = supabase.table(EDGE_TABLE).select("id", count="exact").limit(1)
+    if user is not None:
+        query = query.eq("user", user)
+    return query.execute().count or 0
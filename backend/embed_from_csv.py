@@ -1,29 +1,32 @@
 import pandas as pd
 import requests
-import time
 
 
 df = pd.read_csv("relevant_sites_smaller.csv")
 
-base_url = "http://127.0.0.1:8000/embed-website"
+base_url = "http://127.0.0.1:8000/embed-websites"
 
+# URLs per bulk request
+BATCH_SIZE = 1000
 
+urls = []
 for url in df["origin"]:
+    if pd.isna(url) or not isinstance(url, str):
+        continue
+
+    if not url.startswith("http"):
+        url = "https://" + url
+
+    urls.append(url)
+
+for i in range(0, len(urls), BATCH_SIZE):
+    batch = urls[i:i + BATCH_SIZE]
     try:
-        if pd.isna(url) or not isinstance(url, str):
-            continue
-        
-
-        if not url.startswith("http"):
-            url = "https://" + url
-        
-        print(f"Processing: {url}")
-        
-        response = requests.post(base_url, data={"url": url})
-        
-        print(f"Response: {response.status_code} - {response.json()}")
-        
-        time.sleep(0.5)
+        print(f"Submitting {len(batch)} urls ({i + len(batch)}/{len(urls)})")
+
+        response = requests.post(base_url, json={"urls": batch})
+
+        print(f"Response: {response.status_code} - {response.json()['queued']} queued")
 
     except Exception as e:
-        print(f"Error processing {url}: {str(e)}")
+        print(f"Error submitting batch starting at {i}: {str(e)}")
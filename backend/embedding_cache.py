@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+# Two-tier cache for query embeddings.
+#
+# A bounded in-memory LRU sits in front of a local SQLite file, so repeated
+# axis words and searches survive restarts without another Gemini call.
+# Concurrent requests for the same key share one in-flight load.
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+Key = tuple[str, str, str]
+BatchLoader = Callable[[list[Key]], Awaitable[list[list[float]]]]
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory: OrderedDict[Key, list[float]] = OrderedDict()
+        self.in_flight: dict[Key, asyncio.Future] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _disk_key(key: Key) -> str:
+        return "\x1f".join(key)
+
+    def _read_disk(self, key: Key) -> Optional[list[float]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (self._disk_key(key),)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def _write_disk(self, key: Key, vector: list[float]):
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+                (self._disk_key(key), blob, time.time())
+            )
+
+    def _remember(self, key: Key, vector: list[float]):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    async def get_or_load_many(self, keys: list[Key], loader: BatchLoader) -> list[list[float]]:
+        """
+        Vectors for keys, from memory, disk or the loader, in order. Every key
+        that misses both tiers is loaded with a single loader call, so a batch
+        of misses costs one upstream request.
+        """
+        found: dict[Key, list[float]] = {}
+        waiting: dict[Key, asyncio.Future] = {}
+        unresolved: list[Key] = []
+        for key in dict.fromkeys(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                found[key] = vector
+            elif key in self.in_flight:
+                self.coalesced += 1
+                waiting[key] = self.in_flight[key]
+            else:
+                unresolved.append(key)
+
+        owned = {key: asyncio.get_running_loop().create_future() for key in unresolved}
+        self.in_flight.update(owned)
+        try:
+            missing = []
+            for key, vector in zip(unresolved, await asyncio.to_thread(self._read_disk_many, unresolved)):
+                if vector is not None:
+                    self.disk_hits += 1
+                    found[key] = vector
+                else:
+                    self.misses += 1
+                    missing.append(key)
+            if missing:
+                vectors = await loader(missing)
+                await asyncio.to_thread(self._write_disk_many, missing, vectors)
+                found.update(zip(missing, vectors))
+            for key in unresolved:
+                self._remember(key, found[key])
+                owned[key].set_result(found[key])
+        except asyncio.CancelledError:
+            for future in owned.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+            raise
+        finally:
+            for key in unresolved:
+                del self.in_flight[key]
+
+        for key, future in waiting.items():
+            found[key] = await asyncio.shield(future)
+        return [found[key] for key in keys]
+
+    def _read_disk_many(self, keys: list[Key]) -> list[Optional[list[float]]]:
+        return [self._read_disk(key) for key in keys]
+
+    def _write_disk_many(self, keys: list[Key], vectors: list[list[float]]):
+        for key, vector in zip(keys, vectors):
+            self._write_disk(key, vector)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "entries_in_memory": len(self.memory),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+        }
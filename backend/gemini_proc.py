@@ -1,3 +1,4 @@
+import asyncio
 from typing import List, Dict
 from fastapi import UploadFile
 import google.generativeai as genai
@@ -6,6 +7,8 @@ from PIL.Image import Image
 import base64
 import os
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, normalize_query
+from rate_limiter import gemini_embed_limiter
 
 load_dotenv()
 
@@ -13,29 +16,72 @@ load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_KEY"))
 model_flash = genai.GenerativeModel('gemini-2.0-flash')
 
-async def generate_embedding(text : str):
-        return genai.embed_content(
-            model="gemini-embedding-exp-03-07",
+EMBEDDING_MODEL = "gemini-embedding-exp-03-07"
+
+# Query embeddings (axis words, searches) repeat constantly, so they are cached
+query_embedding_cache = EmbeddingCache()
+
+async def generate_embedding(text, task_type: str = "retrieval_document"):
+        # Accepts one string or a list of strings (one batched request).
+        # The SDK call is blocking, so run it off the event loop
+        return await asyncio.to_thread(
+            genai.embed_content,
+            model=EMBEDDING_MODEL,
             content=text,
-            task_type="retrieval_document"
+            task_type=task_type
         )
 
 
-async def img_and_txt_to_description(web_text: str, images: List[Image] ) -> str:
+async def embed_query(text: str, task_type: str = "retrieval_document"):
     """
-    Analyzes a list of image byte dictionaries and website text using Gemini Pro 1.5.
-    Each image part must contain 'data' (bytes) and 'mime_type' (e.g., 'image/png').
+    Cached generate_embedding for short, repeated query strings. Only cache
+    misses wait on the Gemini embed rate limiter and spend quota.
     """
-    prompt = '''Analyze the website data provided by this text and images. 
+    return {"embedding": (await embed_queries([text], task_type))[0]}
+
+
+async def embed_queries(texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+    """
+    Cached embeddings for several query strings. All cache misses are sent to
+    Gemini as one batched embed_content request.
+    """
+    keys = [(EMBEDDING_MODEL, task_type, normalize_query(text)) for text in texts]
+    # Only the cache key is normalized; Gemini gets the caller's text (the
+    # first spelling seen, when several normalize to the same key)
+    originals = {}
+    for key, text in zip(keys, texts):
+        originals.setdefault(key, text)
+
+    async def load(missing):
+        await gemini_embed_limiter.acquire()
+        result = await generate_embedding([originals[key] for key in missing], task_type)
+        return result["embedding"]
+
+    return await query_embedding_cache.get_or_load_many(keys, load)
+
+
+DESCRIPTION_PROMPT = '''Analyze the website data provided by this text and images. 
     Describe the overall vibe and ambiance it conveys using descriptive words related to mood and feeling (e.g., calm, energetic, sophisticated, playful, serious, etc.). 
     Then, analyze the key design elements contributing to this vibe, such as color palette, typography, imagery, use of white space, layout, and any interactive elements. 
     Explain how these design choices reinforce the overall mood you identified. 
     Please provide your analysis in no more than 2048 tokens.'''
 
-    contents = [web_text, *images, prompt]
+
+async def describe_website(web_text: str, images: List[Image]) -> str:
+    """Asks Gemini for a description of the site's vibe from its text and screenshots."""
+    contents = [web_text, *images, DESCRIPTION_PROMPT]
+    response = await asyncio.to_thread(model_flash.generate_content, contents=contents, stream=False)
+    return response.text
+
+
+async def img_and_txt_to_description(web_text: str, images: List[Image] ) -> str:
+    """
+    Analyzes a list of image byte dictionaries and website text using Gemini Pro 1.5.
+    Each image part must contain 'data' (bytes) and 'mime_type' (e.g., 'image/png').
+    """
     try:
-        response = model_flash.generate_content(contents=contents, stream=False)
-        embedding = await generate_embedding(response.text)
-        return {"error": None, "embedding": embedding, "text": response.text}
+        text = await describe_website(web_text, images)
+        embedding = await generate_embedding(text)
+        return {"error": None, "embedding": embedding, "text": text}
     except Exception as e:
         return {"error": e, "embedding": None, "text": None}
\ No newline at end of file
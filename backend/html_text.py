@@ -0,0 +1,29 @@
+import re
+
+from bs4 import BeautifulSoup
+
+# Visible text of an HTML page, for text embedding.
+#
+# Raw HTML is mostly <head>, scripts, styles and markup; fed to a 512-token
+# model it leaves little room for what a visitor actually reads. This keeps
+# the page title and the text a browser would render.
+
+HIDDEN_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "head", "meta", "link"]
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def visible_text(html: str) -> str:
+    if not html:
+        return ""
+    soup = BeautifulSoup(html, "lxml")
+    title = soup.title.get_text(" ", strip=True) if soup.title else ""
+    for tag in soup(HIDDEN_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(attrs={"hidden": True}):
+        tag.decompose()
+    for tag in soup.find_all(attrs={"aria-hidden": "true"}):
+        tag.decompose()
+    body = soup.get_text(" ", strip=True)
+    text = f"{title}. {body}" if title and not body.startswith(title) else body
+    return WHITESPACE.sub(" ", text).strip()
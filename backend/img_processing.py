@@ -1,107 +1,269 @@
-from transformers import BlipProcessor, BlipForConditionalGeneration, CLIPProcessor, CLIPModel 
 import torch
 from fastapi import FastAPI, File, UploadFile, Form
 from PIL import Image, UnidentifiedImageError
+import asyncio
 import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+from urllib.parse import urlparse
 import numpy as np
+import psutil
 import httpx
 import aiohttp
 
-# Load the BLIP model and processor
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large")  
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").to("cuda" if torch.cuda.is_available() else "cpu")
+from model_registry import models
 
-# Load the CLIP model and processor
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to("cuda" if torch.cuda.is_available() else "cpu")
+# Models are loaded on first use through the registry (model_registry.py)
+def load_blip():
+    from transformers import BlipProcessor, BlipForConditionalGeneration
 
+    # Load the BLIP model and processor
+    blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large")
+    blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").to("cuda" if torch.cuda.is_available() else "cpu")
+    return blip_processor, blip_model
 
-async def get_image_embeddings(files: list[UploadFile] = File(...)):
-    all_combined_embeddings = []
-    
-    # Process each uploaded image
-    for file in files:
-        print("proc file")
-        # Read the image data from the uploaded file
-        img_data = await file.read()
-        img = Image.open(io.BytesIO(img_data))
+def load_clip():
+    from transformers import CLIPProcessor, CLIPModel
 
-        # Generate the description based on the uploaded image
-        description = generate_description(img)
-        
-        # Get individual image and text embeddings
-        image_embeddings, text_embeddings = make_clip_embedding(img, description=description)
+    # Load the CLIP model and processor
+    clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to("cuda" if torch.cuda.is_available() else "cpu")
+    return clip_processor, clip_model
 
-        # Combine the image and text embeddings (e.g., by averaging or concatenating)
-        # Option 1: Average the image and text embeddings
-        combined_embedding = np.mean([image_embeddings, text_embeddings], axis=0)
+models.register("blip", load_blip)
+models.register("clip", load_clip)
 
-        # Append the combined embedding to the list
-        all_combined_embeddings.append(combined_embedding)
-    
-    # Aggregate all combined embeddings (mean across all images)
-    combined_final_embedding = np.mean(all_combined_embeddings, axis=0).tolist()
+CAPTION_PROMPT = "a website with an atmosphere that feels"
 
-    # Return the final aggregated vector that captures the "mood/vibe"
-    
-    return combined_final_embedding
+# Images per inference batch. 0 sizes batches from free memory (GPU memory
+# on CUDA, system RAM otherwise); a batch that runs out of memory is halved
+# and retried, and the size creeps back up after successful batches.
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "0"))
+MAX_IMAGE_BATCH = 32
+# Rough peak memory for one image through BLIP-large generate + CLIP
+BYTES_PER_IMAGE = 256 * 1024 * 1024
 
-async def get_image_embeddings_for_urls(urls: list[str]):
-    all_combined_embeddings = []
-    
-    # Process each uploaded image
 
-    async with aiohttp.ClientSession() as session:
+def is_out_of_memory(e: Exception) -> bool:
+    return isinstance(e, torch.cuda.OutOfMemoryError) or "out of memory" in str(e).lower()
+
+
+class AdaptiveBatchSize:
+    def __init__(self, fixed: int = IMAGE_BATCH_SIZE, maximum: int = MAX_IMAGE_BATCH):
+        self.fixed = fixed
+        self.maximum = maximum
+        self.ceiling = maximum
+        self.successes = 0
+
+    def available_bytes(self) -> int:
+        if torch.cuda.is_available():
+            free, _ = torch.cuda.mem_get_info()
+            return free
+        return psutil.virtual_memory().available
+
+    def current(self) -> int:
+        if self.fixed > 0:
+            return self.fixed
+        from_memory = max(1, self.available_bytes() // BYTES_PER_IMAGE)
+        return int(min(from_memory, self.ceiling))
+
+    def shrink(self, failed_size: int):
+        self.ceiling = max(1, failed_size // 2)
+        self.successes = 0
+
+    def grew_ok(self):
+        # After a run of clean batches, allow one more image per batch
+        self.successes += 1
+        if self.successes >= 10 and self.ceiling < self.maximum:
+            self.ceiling += 1
+            self.successes = 0
+
+
+image_batch_size = AdaptiveBatchSize()
+
+# Image downloads run concurrently, bounded per fetch_images call and per host. Bodies
+# over IMAGE_MAX_BYTES are abandoned mid-read, and decoding plus downscaling
+# happens in a thread pool so the event loop keeps downloading. BLIP and CLIP
+# resize to 384px / 224px anyway, so images are shrunk to IMAGE_MAX_SIDE.
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "16"))
+IMAGE_FETCH_PER_HOST = int(os.getenv("IMAGE_FETCH_PER_HOST", "4"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "15"))
+IMAGE_MAX_SIDE = 512
+IMAGE_DECODE_WORKERS = 4
+
+decode_pool = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix="image-decode")
+
+
+def decode_image(img_data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(img_data))
+    # Lets JPEG decode straight at a reduced scale
+    img.draft("RGB", (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    img = img.convert("RGB")
+    img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+    return img
+
+
+async def decode_off_loop(img_data: bytes) -> Image.Image:
+    return await asyncio.get_running_loop().run_in_executor(decode_pool, decode_image, img_data)
 
-        for url in urls:
-            try:
-                response = await session.get(url)
 
+async def fetch_image(session: aiohttp.ClientSession, url: str, fetch_slots: asyncio.Semaphore,
+                      host_slots: asyncio.Semaphore) -> Optional[Image.Image]:
+    """Download and decode one image, or None if it is skipped or fails."""
+    try:
+        async with host_slots, fetch_slots:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT)) as response:
                 if response.status != 200:
                     print(f"Failed to fetch {url}: status {response.status}")
-                    continue
+                    return None
 
                 content_type = response.headers.get('Content-Type', '')
                 if 'svg' in content_type or url.endswith('.svg'):
                     print(f"Skipping SVG image: {url}")
-                    continue
+                    return None
 
-                img_data = await response.read()
+                if (response.content_length or 0) > IMAGE_MAX_BYTES:
+                    print(f"Skipping oversized image ({response.content_length} bytes): {url}")
+                    return None
 
-                try:
-                    img = Image.open(io.BytesIO(img_data)).convert("RGB")
-                except UnidentifiedImageError:
-                    print(f"Cannot identify image file: {url}")
-                    continue
+                img_data = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    img_data.extend(chunk)
+                    if len(img_data) > IMAGE_MAX_BYTES:
+                        print(f"Skipping oversized image (> {IMAGE_MAX_BYTES} bytes): {url}")
+                        return None
 
-                # Generate the description based on the uploaded image
-                description = generate_description(img)
-                
-                # Get individual image and text embeddings
-                image_embeddings, text_embeddings = make_clip_embedding(img, description=description)
+        return await decode_off_loop(bytes(img_data))
 
-                # Combine the image and text embeddings (e.g., by averaging or concatenating)
-                # Option 1: Average the image and text embeddings
-                combined_embedding = np.mean([image_embeddings, text_embeddings], axis=0)
+    except UnidentifiedImageError:
+        print(f"Cannot identify image file: {url}")
+    except Exception as e:
+        print(f"Error processing image {url}: {e}")
+    return None
 
-                # Append the combined embedding to the list
-                all_combined_embeddings.append(combined_embedding)
-            
-            except Exception as e:
-                print(f"Error processing image {url}: {e}")
-                continue
+
+async def fetch_images(urls: list[str]) -> AsyncIterator[Image.Image]:
+    """Decoded images for the unique urls, yielded in the order they finish."""
+    urls = list(dict.fromkeys(urls))
+    # Created per call, on the running loop, and only for the hosts in this call
+    fetch_slots = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+    host_slots = {
+        host: asyncio.Semaphore(IMAGE_FETCH_PER_HOST) for host in {urlparse(url).netloc for url in urls}
+    }
+    async with aiohttp.ClientSession() as session:
+        tasks = [
+            asyncio.create_task(fetch_image(session, url, fetch_slots, host_slots[urlparse(url).netloc]))
+            for url in urls
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                img = await next_done
+                if img is not None:
+                    yield img
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def get_image_embeddings(files: list[UploadFile] = File(...)):
+    images = []
+    for file in files:
+        # Read the image data from the uploaded file
+        img_data = await file.read()
+        images.append(await decode_off_loop(img_data))
+
+    # Caption and embed every image in batches; each entry averages the image
+    # and caption embeddings
+    all_combined_embeddings = embed_images(images)
+
+    # Aggregate all combined embeddings (mean across all images)
+    # -> the final aggregated vector that captures the "mood/vibe"
+    return np.mean(all_combined_embeddings, axis=0).tolist()
+
+async def get_image_embeddings_for_urls(urls: list[str]):
+    # Images are embedded a batch at a time in a worker thread while the
+    # remaining downloads continue; one batch runs at a time
+    all_combined_embeddings = []
+    pending = []
+    inference = None
+
+    async def flush(batch):
+        nonlocal inference
+        if inference is not None:
+            all_combined_embeddings.append(await inference)
+        inference = asyncio.create_task(asyncio.to_thread(embed_images, batch))
+
+    try:
+        async for img in fetch_images(urls):
+            pending.append(img)
+            if len(pending) >= image_batch_size.current():
+                await flush(pending)
+                pending = []
+        if pending:
+            await flush(pending)
+        if inference is not None:
+            all_combined_embeddings.append(await inference)
+            inference = None
+    finally:
+        if inference is not None:
+            inference.cancel()
 
     if not all_combined_embeddings:
         return None
-    
+
     # Aggregate all combined embeddings (mean across all images)
-    combined_final_embedding = np.mean(all_combined_embeddings, axis=0).tolist()
+    # -> the final aggregated vector that captures the "mood/vibe"
+    return np.mean(np.concatenate(all_combined_embeddings), axis=0).tolist()
 
-    # Return the final aggregated vector that captures the "mood/vibe"
-    
-    return combined_final_embedding
+def embed_images(images: list[Image.Image]) -> np.ndarray:
+    """
+    Combined (mean of CLIP image and caption) embedding per image, computed in
+    batches: one BLIP generate call and one CLIP image/text pass per batch.
+    """
+    results = []
+    start = 0
+    while start < len(images):
+        size = image_batch_size.current()
+        batch = images[start:start + size]
+        try:
+            descriptions = generate_descriptions(batch)
+            image_embeddings, text_embeddings = make_clip_embeddings(batch, descriptions)
+        except Exception as e:
+            if not is_out_of_memory(e) or len(batch) == 1:
+                raise
+            print(f"[Images] Out of memory at batch size {len(batch)}, halving")
+            image_batch_size.shrink(len(batch))
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            continue
+        image_batch_size.grew_ok()
+        results.append((image_embeddings + text_embeddings) / 2)
+        start += len(batch)
+    return np.concatenate(results) if results else np.zeros((0, 0), dtype=np.float32)
+
+def generate_descriptions(images: list[Image.Image], prompt: str = CAPTION_PROMPT) -> list[str]:
+    """BLIP captions for a batch of images in one generate call."""
+    blip_processor, blip_model = models.get("blip")
+    inputs = blip_processor(images=images, text=[prompt] * len(images), return_tensors="pt", padding=True).to(blip_model.device)
+    with torch.no_grad():
+        output = blip_model.generate(**inputs, min_length=30, max_length=70, num_beams=1, temperature=0.8, do_sample=True)
+    return blip_processor.batch_decode(output, skip_special_tokens=True)
+
+def make_clip_embeddings(images: list[Image.Image], descriptions: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """CLIP image features and caption text features for a batch, as (n, 512) arrays."""
+    clip_processor, clip_model = models.get("clip")
+    inputs = clip_processor(text=descriptions, images=images, return_tensors="pt", padding=True, truncation=True).to(clip_model.device)
+
+    with torch.no_grad():
+        image_embeddings = clip_model.get_image_features(pixel_values=inputs["pixel_values"])
+        text_embeddings = clip_model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+
+    return image_embeddings.cpu().numpy(), text_embeddings.cpu().numpy()
 
 def generate_description(img: Image.Image):
+    blip_processor, blip_model = models.get("blip")
     # Try different prompts to get more detailed descriptions
     prompts = [
     "a website with an atmosphere that feels",
@@ -125,6 +287,7 @@ def generate_description(img: Image.Image):
     return descriptions[0]
 
 def make_clip_embedding(img: Image.Image, description: str):
+    clip_processor, clip_model = models.get("clip")
     # Preprocess the image and text for the CLIP model
     inputs = clip_processor(text=[description], images=img, return_tensors="pt", padding=True)
 
@@ -146,6 +309,7 @@ def make_clip_embedding(img: Image.Image, description: str):
 
 # For site content
 def clip_text_embedding(text: str):
+    clip_processor, clip_model = models.get("clip")
     # Tokenize the text for CLIP
     inputs = clip_processor(text=[text], return_tensors="pt", padding=True).to(clip_model.device)
 
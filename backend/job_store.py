@@ -0,0 +1,198 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Optional
+
+# Durable job queue for /embed-website, backed by a local SQLite file.
+#
+# Every uvicorn worker process opens the same file, so jobs survive restarts
+# and can be drained by several processes at once. A worker "claims" a job by
+# taking a lease on it; if the worker dies the lease expires and the job is
+# picked up again by someone else.
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "86400"))
+
+ACTIVE_STATUSES = ("queued", "processing")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at);
+"""
+
+
+class JobStore:
+    def __init__(self, path: str = JOB_DB_PATH, lease_seconds: float = JOB_LEASE_SECONDS,
+                 ttl_seconds: float = JOB_TTL_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # A fresh connection per operation keeps the store safe to share
+        # between threads; SQLite connections are cheap to open.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def enqueue(self, url: str) -> tuple[str, bool]:
+        """
+        Queue a URL. If the URL already has a queued or in-flight job, that
+        job's id is returned instead. Returns (job_id, created).
+        """
+        return self.enqueue_many([url])[url]
+
+    def enqueue_many(self, urls: list[str]) -> dict[str, tuple[str, bool]]:
+        """Bulk enqueue in a single transaction. Returns {url: (job_id, created)}."""
+        now = time.time()
+        jobs = {}
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for url in urls:
+                row = conn.execute(
+                    "SELECT job_id FROM jobs WHERE url = ? AND status IN (?, ?) LIMIT 1",
+                    (url, *ACTIVE_STATUSES)
+                ).fetchone()
+                if row is not None:
+                    jobs[url] = (row["job_id"], False)
+                    continue
+                job_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO jobs (job_id, url, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                    (job_id, url, now, now)
+                )
+                jobs[url] = (job_id, True)
+            conn.execute("COMMIT")
+            return jobs
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim(self, worker_id: str) -> Optional[tuple[str, str]]:
+        """
+        Lease the oldest runnable job for this worker. A job is runnable if it
+        is queued, or if it is processing but its lease has expired.
+        Returns (job_id, url) or None if there is nothing to do.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT job_id, url FROM jobs
+                WHERE status = 'queued'
+                   OR (status = 'processing' AND lease_expires < ?)
+                ORDER BY created_at
+                LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'processing', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (worker_id, now + self.lease_seconds, now, row["job_id"])
+            )
+            conn.execute("COMMIT")
+            return row["job_id"], row["url"]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def extend_lease(self, job_id: str, worker_id: str) -> bool:
+        """Push the lease deadline forward for a long-running job."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (now + self.lease_seconds, now, job_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+    def finish(self, job_id: str, result: dict):
+        """Record the outcome of a job. result["status"] becomes the job status."""
+        status = result.get("status", "completed")
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (status, json.dumps(result, default=str), time.time(), job_id)
+            )
+
+    def requeue(self, job_id: str, message: Optional[str] = None):
+        """Put a claimed job back at the end of the queue (e.g. after a rate limit)."""
+        now = time.time()
+        result = json.dumps({"message": message}) if message else None
+        with closing(self._connect()) as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = 'queued', result = ?, lease_owner = NULL, lease_expires = NULL,
+                    created_at = ?, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (result, now, now, job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT job_id, url, status, result, attempts, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row["result"]) if row["result"] else {}
+        job.update({"status": row["status"], "url": row["url"]})
+        return job
+
+    def evict_finished(self) -> int:
+        """Delete finished job records older than the TTL. Returns rows removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                (*ACTIVE_STATUSES, cutoff)
+            )
+            return cur.rowcount
+
+    def counts(self) -> dict:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Local vector store that can stand in for the Pinecone index on the query
+# paths. Site embeddings live in a float32 memory-mapped matrix with an id
+# table next to it; queries are a single NumPy matrix-vector product plus an
+# argpartition top-k, so there is no network round trip per search.
+#
+# The store implements the subset of the Pinecone Index API that the backend
+# uses (query, fetch, upsert), so it can be swapped in wherever `index` was.
+#
+#   python local_index.py sync    # bulk copy every vector from Pinecone
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+LOCAL_INDEX_METRIC = os.getenv("LOCAL_INDEX_METRIC", "cosine")
+EMBEDDING_DIM = 3072
+
+INITIAL_CAPACITY = 1024
+SYNC_FETCH_CHUNK = 100
+
+
+class QueryResponse:
+    def __init__(self, matches: list[dict]):
+        self.matches = matches
+
+
+class FetchResponse:
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+        self.namespace = ""
+        self.usage = None
+
+
+class LocalVectorIndex:
+    def __init__(self, path: str = LOCAL_INDEX_DIR, dim: int = EMBEDDING_DIM, metric: str = LOCAL_INDEX_METRIC):
+        self.path = path
+        self.metric = metric
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.matrix_path = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.json")
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as file:
+                meta = json.load(file)
+            self.dim = meta["dim"]
+            self.capacity = meta["capacity"]
+            self.ids: list[str] = meta["ids"]
+        else:
+            self.dim = dim
+            self.capacity = INITIAL_CAPACITY
+            self.ids = []
+            with open(self.matrix_path, "wb") as file:
+                file.truncate(self.capacity * self.dim * 4)
+            self._save_meta()
+
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        self.norms = np.linalg.norm(self.matrix[:len(self.ids)], axis=1).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _save_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "ids": self.ids}, file)
+        os.replace(tmp, self.meta_path)
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        # Growing the file leaves the old mapping valid, so concurrent
+        # queries can keep reading it until the new one is swapped in
+        self.matrix.flush()
+        with open(self.matrix_path, "r+b") as file:
+            file.truncate(capacity * self.dim * 4)
+        self.capacity = capacity
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def upsert(self, vectors: list[dict], namespace: str = ""):
+        with self.lock:
+            new_ids = [v["id"] for v in vectors if v["id"] not in self.positions]
+            new_ids = list(dict.fromkeys(new_ids))
+            if len(self.ids) + len(new_ids) > self.capacity:
+                self._grow(len(self.ids) + len(new_ids))
+            for vector_id in new_ids:
+                self.positions[vector_id] = len(self.ids)
+                self.ids.append(vector_id)
+            if len(self.norms) < len(self.ids):
+                self.norms = np.concatenate([self.norms, np.zeros(len(self.ids) - len(self.norms), dtype=np.float32)])
+
+            rows = np.array([self.positions[v["id"]] for v in vectors], dtype=np.int64)
+            values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            if values.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension mismatch: {values.shape[1]} (needs to be {self.dim})")
+            self.matrix[rows] = values
+            self.norms[rows] = np.linalg.norm(values, axis=1)
+            self.matrix.flush()
+            self._save_meta()
+        return {"upserted_count": len(vectors)}
+
+    def fetch(self, ids: list[str], namespace: str = "") -> FetchResponse:
+        found = {}
+        for vector_id in ids:
+            row = self.positions.get(vector_id)
+            if row is not None:
+                found[vector_id] = {"id": vector_id, "values": self.matrix[row].tolist()}
+        return FetchResponse(found)
+
+    def scores(self, vector) -> np.ndarray:
+        """Similarity of every stored vector to the query, in id-table order."""
+        q = np.asarray(vector, dtype=np.float32)
+        matrix, norms = self.matrix, self.norms
+        n = min(len(self.ids), len(norms))
+        scores = matrix[:n] @ q
+        if self.metric == "cosine":
+            scores /= np.maximum(norms[:n] * np.linalg.norm(q), 1e-12)
+        return scores
+
+    def scores_for(self, rows: np.ndarray, vector) -> np.ndarray:
+        """Similarity of the given rows to the query."""
+        q = np.asarray(vector, dtype=np.float32)
+        scores = self.matrix[rows] @ q
+        if self.metric == "cosine":
+            scores /= np.maximum(self.norms[rows] * np.linalg.norm(q), 1e-12)
+        return scores
+
+    def query(self, vector, top_k: int = 10, include_values: bool = False, include_metadata: bool = False,
+              namespace: str = "", **kwargs) -> QueryResponse:
+        scores = self.scores(vector)
+        n = len(scores)
+        if n == 0:
+            return QueryResponse([])
+        k = min(top_k, n)
+        if k < n:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for row in top:
+            match = {"id": self.ids[row], "score": float(scores[row])}
+            if include_values:
+                match["values"] = self.matrix[row].tolist()
+            matches.append(match)
+        return QueryResponse(matches)
+
+    def sync_from(self, source, namespace: str = "", chunk_size: int = SYNC_FETCH_CHUNK) -> int:
+        """Copy every vector out of a Pinecone index in bulk. Returns the number copied."""
+        copied = 0
+        for id_page in source.list(namespace=namespace):
+            for i in range(0, len(id_page), chunk_size):
+                chunk = id_page[i:i + chunk_size]
+                response = source.fetch(ids=chunk, namespace=namespace)
+                vectors = [{"id": vector_id, "values": list(v.values)} for vector_id, v in response.vectors.items()]
+                if vectors:
+                    self.upsert(vectors)
+                    copied += len(vectors)
+            print(f"[LocalIndex] Synced {copied} vectors...")
+        return copied
+
+
+def open_search_index(backend: str, pinecone_index) -> tuple[object, Optional[object]]:
+    """
+    Pick the index used for queries: "pinecone", "local" (exact search) or
+    "ivf" (approximate search over the local store, see ann_index.py).
+    Returns (search_index, local index to mirror upserts into, or None).
+    """
+    if backend in ("local", "ivf"):
+        local = LocalVectorIndex()
+        print(f"[LocalIndex] Loaded {len(local)} vectors from {local.path}")
+        if backend == "ivf":
+            from ann_index import IVFIndex
+            ann = IVFIndex(local)
+            return ann, ann
+        return local, local
+    return pinecone_index, None
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    if len(sys.argv) < 2 or sys.argv[1] != "sync":
+        print("usage: python local_index.py sync")
+        sys.exit(1)
+
+    load_dotenv()
+    pc = Pinecone(api_key=os.getenv("PINECONE_KEY"))
+    source = pc.Index(host=os.getenv("PINECONE_INDEX_HOST"))
+    local = LocalVectorIndex()
+    total = local.sync_from(source)
+    print(f"[LocalIndex] Done, {total} vectors copied, {len(local)} in store.")
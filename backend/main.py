@@ -2,27 +2,43 @@
 # main.py with simplified background queue and rate limiting
 
 from PIL import Image 
-from fastapi import FastAPI, File, UploadFile, Form, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from crawl_and_embed import crawl_and_return 
-from gemini_proc import img_and_txt_to_description, generate_embedding
+from gemini_proc import describe_website, generate_embedding, embed_query, embed_queries, query_embedding_cache
 from pinecone import Pinecone 
 from dotenv import load_dotenv
+import importlib
 import io
+import json
 import os
-import uuid
 import numpy as np
 import pandas as pd
 import asyncio
 import time
 from datetime import datetime
-import queue
-import threading
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, BrowserConfig
-from typing import Optional, List
+from typing import Iterable, Iterator, Optional, List
+from itertools import islice
 from collections import defaultdict
 from supabase import create_client, Client
-from text_processing import get_text_embeddings
+from model_registry import models
+from job_store import JobStore
+from pipeline import EmbedPipeline, Stage, PipelineError, CRAWL_CONCURRENCY, DESCRIBE_WORKERS, EMBED_WORKERS, UPSERT_WORKERS
+from upsert_batcher import UpsertBatcher
+from content_cache import ContentCache
+from local_index import open_search_index
+from rankings_store import RankingsStore
+from precompute_job import PrecomputeJob
+from node_stats import NodeStatsStore
+from response_cache import ResponseCache, canonical
+from columnar import ARROW_MEDIA_TYPE, wants_arrow, rows_to_table, columns_to_table, arrow_response, format_stats
+from edge_graph import EdgeGraph
+from domain_dict import DomainDictionary
+from edge_source import iter_edge_pages, iter_rpc_pages, fetch_edges_after, count_edges, encode_cursor, decode_cursor, edge_key
+from pydantic import BaseModel
+from rate_limiter import gemini_generate_limiter, gemini_embed_limiter, pinecone_limiter, limiter_stats
+from contextlib import asynccontextmanager
 import asyncio  # make sure imported
 import csv
 import random
@@ -37,15 +53,72 @@ url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_ADMIN_KEY")
 SUPABASE: Client = create_client(url, key)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Launch the browser once and keep it for the life of the app; every crawl
+    # worker shares it instead of relaunching Chromium per page
+    await crawler.start()
+    upsert_batcher.start()
+    embed_pipeline.start()
+    edge_refresher = asyncio.create_task(keep_edges_fresh())
+    model_trimmer = asyncio.create_task(unload_idle_models())
+    try:
+        yield
+    finally:
+        edge_refresher.cancel()
+        model_trimmer.cancel()
+        await embed_pipeline.stop()
+        await upsert_batcher.stop()
+        await crawler.close()
+
 #Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Initialize Pinecone
 pc = Pinecone(api_key=os.getenv("PINECONE_KEY"))
 index = pc.Index(host=os.getenv("PINECONE_INDEX_HOST"))
 
-# Create a job queue
-job_queue = queue.Queue()
+# Index used by the query endpoints: "pinecone" (default), "local" for the
+# memory-mapped store in local_index.py, or "ivf" for approximate search over
+# that store (ann_index.py). Pinecone stays the source of truth
+# for writes; a local store is kept current by mirroring every upsert.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+search_index, local_index = open_search_index(VECTOR_BACKEND, index)
+
+# Durable job queue shared by every worker process
+job_store = JobStore()
+
+# Finished embeddings are written to Pinecone in batches
+upsert_batcher = UpsertBatcher(index, mirrors=[local_index] if local_index is not None else [])
+
+# Gemini descriptions and embeddings keyed by page content fingerprint
+content_cache = ContentCache()
+
+# Stable int32 ids for every domain, shared by the edge graph and rankings
+domain_dictionary = DomainDictionary()
+
+# Edge-derived aggregates, loaded from browsing_complete and refreshed
+# incrementally in the background
+EDGE_REFRESH_SECONDS = float(os.getenv("EDGE_REFRESH_SECONDS", "600"))
+node_stats_store = NodeStatsStore()
+edge_refresh_lock = asyncio.Lock()
+edges_loaded = False
+
+# The edge endpoints query Supabase directly ("supabase", default) or answer
+# from the in-memory graph in edge_graph.py ("memory"), which is only loaded
+# in that mode
+EDGE_BACKEND = os.getenv("EDGE_BACKEND", "supabase")
+MAX_EDGE_PAGE_SIZE = 10000
+edge_graph = EdgeGraph(domain_dictionary)
+
+# Serialized /get_edges, /target_edge and /get_node_statistics responses,
+# invalidated whenever the edge refresh loads new rows
+response_cache = ResponseCache()
+
+# Precomputed rankings: the Arrow file /precompute_rankings writes to
+# RANKINGS_PATH, or the legacy CSV until one exists. Indexed by query and
+# reloaded on change
+rankings_store = RankingsStore(dictionary=domain_dictionary)
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,148 +135,96 @@ app.add_middleware(
 )
 
 
-# Job status tracking
-job_status = {}
-
 browser_config = BrowserConfig(
     verbose=True
 )
 
 crawler = AsyncWebCrawler(config=browser_config)
 
-# Rate limiting configuration
-class RateLimiter:
-    def __init__(self, calls_per_minute=30):
-        self.calls_per_minute = calls_per_minute
-        self.call_times = []
-        self.lock = threading.Lock()
-    
-    async def wait_if_needed(self):
-        """Wait if we're exceeding the rate limit"""
-        with self.lock:
-            now = time.time()
-            # Remove timestamps older than 1 minute
-            self.call_times = [t for t in self.call_times if t > now - 60]
-            
-            # If we've hit the limit, wait until we can make another call
-            if len(self.call_times) >= self.calls_per_minute:
-                wait_time = 60 - (now - self.call_times[0])
-                if wait_time > 0:
-                    self.lock.release()
-                    await asyncio.sleep(wait_time + 0.1)
-                    self.lock.acquire()
-            
-            # Record this call
-            self.call_times.append(time.time())
-
-# Initialize rate limiter
-gemini_rate_limiter = RateLimiter(calls_per_minute=30)
-
-# Worker function to process jobs in the background
-def process_queue():
-    while True:
-        try:
-            # Get a job from the queue
-            job_id, url = job_queue.get(block=True)
-            
-            # Update status to processing
-            job_status[job_id] = {
-                "status": "processing",
-                "url": url
-            }
-            
-            # Process the job
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                result = loop.run_until_complete(process_website(url, job_id))
-                job_status[job_id].update(result)
-            except Exception as e:
-                job_status[job_id].update({
-                    "status": "error",
-                    "message": f"Error: {str(e)}"
-                })
-            finally:
-                loop.close()
-                job_queue.task_done()
-            
-        except Exception as e:
-            print(f"Worker error: {str(e)}")
-            time.sleep(1)
 
-# Start worker threads
-NUM_WORKERS = 3
-for _ in range(NUM_WORKERS):
-    worker = threading.Thread(target=process_queue, daemon=True)
-    worker.start()
-
-async def process_website(url: str, job_id: str):
-    """Process a website - crawl, generate description and store embedding"""
-    try:
+# Stages of the embed pipeline. Each one takes the job item and returns it
+# for the next stage; large intermediate data is dropped as soon as it has
+# been used so queued items stay small.
+
+async def crawl_stage(item: dict) -> dict:
+    url = item["url"]
+    print(f"[Process] Crawling {url}...")
+    crawl_data = await crawl_and_return(url, crawler)
+    if crawl_data.get("error") or not crawl_data["text"] or not crawl_data["images"]:
+        # Don't describe and index an empty page under this URL
+        raise PipelineError(f"Crawl failed: {crawl_data.get('error') or 'no content returned'}")
+    print(f"[Process] Crawl success. Got text length={len(crawl_data['text'])}, images={len(crawl_data['images'])}")
+    item["text"] = crawl_data["text"]
+    item["images"] = crawl_data["images"]
+
+    # Unchanged content: reuse the stored description and embedding
+    item["fingerprint"] = crawl_data.get("fingerprint")
+    if item["fingerprint"] is not None:
+        cached = await asyncio.to_thread(content_cache.get, item["fingerprint"])
+        if cached is not None:
+            print(f"[Process] Content unchanged for {url}, skipping Gemini.")
+            item.pop("text")
+            item.pop("images")
+            item["description"], item["embedding"] = cached
+            item["cached"] = True
+    return item
+
+
+async def describe_stage(item: dict) -> dict:
+    print(f"[Process] Generating description for {item['url']}...")
+    item["description"] = await describe_website(item.pop("text"), item.pop("images"))
+    return item
+
+
+async def embed_stage(item: dict) -> dict:
+    embedding = await generate_embedding(item["description"])
+    embedding_vector = embedding["embedding"]
+
+    # Check dimensions
+    vector_dim = len(embedding_vector)
+    if vector_dim != 3072:
+        print(f"[Process] Dimension mismatch: {vector_dim}")
+        raise PipelineError(f"Vector dimension mismatch: {vector_dim} (needs to be 3072)")
+
+    item["embedding"] = embedding_vector
+    return item
+
+
+async def upsert_stage(item: dict) -> dict:
+    embedding = item.pop("embedding")
+    if item.get("fingerprint") is not None and not item.get("cached"):
+        await asyncio.to_thread(content_cache.put, item["fingerprint"], item["description"], embedding)
+
+    # The batcher writes to Pinecone in groups and is paced by pinecone_limiter;
+    # the job only completes once the batch holding this vector is written
+    written = await upsert_batcher.add(item["url"], embedding)
+    print(f"[Process] Queued {item['url']} for upsert.")
+    await written
+    return item
+
+
+# Background embed pipeline, run on the app's event loop (see lifespan)
+embed_pipeline = EmbedPipeline(job_store, [
+    Stage("crawl", crawl_stage, CRAWL_CONCURRENCY),
+    Stage("describe", describe_stage, DESCRIBE_WORKERS, limiter=gemini_generate_limiter,
+          skip_if=lambda item: item.get("cached", False)),
+    Stage("embed", embed_stage, EMBED_WORKERS, limiter=gemini_embed_limiter,
+          skip_if=lambda item: item.get("cached", False)),
+    Stage("upsert", upsert_stage, UPSERT_WORKERS),
+])
+
+async def query_search_index(vector, top_k: int):
+    """Top-k query against the configured search backend, off the event loop."""
+    if search_index is index:
+        await pinecone_limiter.acquire()
+    return await asyncio.to_thread(
+        search_index.query,
+        vector=vector,
+        top_k=top_k,
+        include_values=False,
+        include_metadata=True
+    )
 
-        # Crawl website
-        print(f"[Process] Crawling {url}...")
-        crawl_data = await crawl_and_return(url, crawler)
-        print(f"[Process] Crawl success. Got text length={len(crawl_data['text'])}, images={len(crawl_data['images'])}")
-        
-        # Wait for rate limiter before making Gemini API call
-        await gemini_rate_limiter.wait_if_needed()
-        
-        # Generate description and embedding
-        # print(f"[Process] Generating description and embedding for {url}...")
-        # description = await img_and_txt_to_description(crawl_data["text"], crawl_data["images"])
-        
-        # Check if embedding was generated successfully
-        # if description["error"] is not None or description["embedding"] is None:
-        #     print(f"[Process] Embedding generation failed: {description['error']}")
-        #     return {
-        #         "status": "error",
-        #         "message": f"Failed to generate embedding: {description['error']}"
-        #     }
-        
-        # Access the embedding
-        # embedding_vector = description["embedding"]["embedding"]
-        # print(f"[Process] Embedding vector length: {len(embedding_vector)}")
-        
-        # Check dimensions
-        # vector_dim = len(embedding_vector)
-        # if vector_dim != 3072:
-        #     print(f"[Process] Dimension mismatch: {vector_dim}")
-        #     return {
-        #         "status": "error",
-        #         "message": f"Vector dimension mismatch: {vector_dim} (needs to be 3072)"
-        #     }
-        
-        # If dimensions match, proceed with upsert
-        print(f"[Process] Upserting {url} into Pinecone...")
-        # index.upsert(
-        #     vectors=[{
-        #         "id": url,
-        #         "values": embedding_vector
-        #     }],
-        #     namespace=""
-        # )
-        print(f"[Process] Upsert complete for {url}.")
-        
-        return {
-            "status": "completed",
-            "description": None # description["text"]
-        }
-    except Exception as e:
-        # If we get a rate limit error, requeue the job
-        if "rate limit" in str(e).lower() or "quota" in str(e).lower():
-            # Requeue the job
-            job_queue.put((job_id, url))
-            print(f"requeued {url}")
-            return {
-                "status": "requeued",
-                "message": f"Hit rate limit, job requeued"
-            }
-        print(f"Error: {str(e)}")
-        return {
-            "status": "error",
-            "message": f"Error: {str(e)}"
-        }
 
 @app.get("/")
 async def root():
@@ -234,7 +255,8 @@ def diagnose_missing_fetches(url: str, fetch_response):
 @app.post("/embed-website")
 async def embed_website_api(url: str = Form(...)):
     print("=" * 80)
-    fetch_response = index.fetch(ids=[url])
+    await pinecone_limiter.acquire()
+    fetch_response = await asyncio.to_thread(index.fetch, ids=[url])
 
     diagnose_missing_fetches(url, fetch_response)
         
@@ -244,29 +266,96 @@ async def embed_website_api(url: str = Form(...)):
         "url": url
     } 
         
-    # Generate a job ID
-    job_id = str(uuid.uuid4())
+    # Add job to the durable queue (an in-flight job for the same URL is reused)
+    job_id, _ = await asyncio.to_thread(job_store.enqueue, url)
     
-    # Add job to status tracker
-    job_status[job_id] = {
+    return {
         "status": "queued",
+        "job_id": job_id,
         "url": url
     }
-    
-    # Add job to processing queue
-    job_queue.put((job_id, url))
-    
+
+
+# Pinecone fetch takes ids as query parameters, so keep each request modest
+EXISTS_CHUNK_SIZE = 100
+EXISTS_CONCURRENCY = 4
+MAX_BULK_URLS = 10000
+
+
+class EmbedWebsitesRequest(BaseModel):
+    urls: List[str]
+    # Re-crawl sites even if they are already in Pinecone. Unchanged pages
+    # are served from the content cache without calling Gemini.
+    refresh: bool = False
+
+
+async def fetch_existing_ids(ids: List[str]) -> set:
+    """Return the subset of ids that already have a vector in Pinecone."""
+    chunks = [ids[i:i + EXISTS_CHUNK_SIZE] for i in range(0, len(ids), EXISTS_CHUNK_SIZE)]
+    slots = asyncio.Semaphore(EXISTS_CONCURRENCY)
+
+    async def fetch_chunk(chunk):
+        async with slots:
+            await pinecone_limiter.acquire()
+            response = await asyncio.to_thread(index.fetch, ids=chunk)
+            return set(response.vectors.keys())
+
+    existing = set()
+    for found in await asyncio.gather(*(fetch_chunk(c) for c in chunks)):
+        existing |= found
+    return existing
+
+
+@app.post("/embed-websites")
+async def embed_websites_api(request: EmbedWebsitesRequest):
+    # Keep first occurrence order, drop blanks and duplicates
+    urls = list(dict.fromkeys(u.strip() for u in request.urls if u and u.strip()))
+    if len(urls) > MAX_BULK_URLS:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "message": f"At most {MAX_BULK_URLS} urls per request"}
+        )
+
+    existing = set() if request.refresh else await fetch_existing_ids(urls)
+    missing = [u for u in urls if u not in existing]
+    jobs = await asyncio.to_thread(job_store.enqueue_many, missing)
+
     return {
         "status": "queued",
-        "job_id": job_id,
-        "url": url
+        "submitted": len(urls),
+        "existing": len(existing),
+        "queued": sum(1 for _, created in jobs.values() if created),
+        "already_queued": sum(1 for _, created in jobs.values() if not created),
+        "jobs": {u: job_id for u, (job_id, _) in jobs.items()}
     }
 
 
+@app.get("/worker-stats")
+async def get_worker_stats():
+    stats = embed_pipeline.stats()
+    stats["jobs"] = await asyncio.to_thread(job_store.counts)
+    stats["upserted"] = upsert_batcher.upserted
+    stats["pending_upserts"] = len(upsert_batcher.pending)
+    stats["content_cache"] = content_cache.stats()
+    return stats
+
+
+@app.get("/embedding-cache-stats")
+async def get_embedding_cache_stats():
+    return query_embedding_cache.stats()
+
+
+@app.get("/rate-limits")
+async def get_rate_limits():
+    """Current bucket levels and expected wait per upstream API."""
+    return await limiter_stats()
+
+
 @app.get("/job-status/{job_id}")
 async def get_job_status(job_id: str):
-    if job_id in job_status:
-        return job_status[job_id]
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is not None:
+        return job
     else:
         return JSONResponse(
             status_code=404,
@@ -301,15 +390,10 @@ import csv  # ← Add this at the top of your file
 
 @app.post("/search_vectors")
 async def search_web_embeddings(query: str = Form(...), k_returns: int = Form(5)):
-    query_vector_response = await generate_embedding(query)
+    query_vector_response = await embed_query(query)
     query_vector = query_vector_response["embedding"] if isinstance(query_vector_response, dict) else query_vector_response
 
-    search_results = index.query(
-        vector=query_vector,
-        top_k=k_returns,
-        include_values=False,
-        include_metadata=True
-    )
+    search_results = await query_search_index(query_vector, k_returns)
 
     formatted_results = [{"id": match.get("id", ""), "score": match.get("score", 0)} for match in search_results.matches]
 
@@ -326,6 +410,7 @@ async def search_web_embeddings(query: str = Form(...), k_returns: int = Form(5)
 
 @app.get("/get_coordinates")
 async def get_coordinates(
+    request: Request,
     axis1: str = Query(...),
     axis2: str = Query(...),
     axis3: Optional[str] = Query(None),
@@ -333,22 +418,12 @@ async def get_coordinates(
 ):
     queries = [axis1, axis2] if axis3 is None else [axis1, axis2, axis3]
 
-    embeddings = []
-    for query in queries:
-        await gemini_rate_limiter.wait_if_needed()
-        embedding_result = await generate_embedding(query)
-        embedding = embedding_result["embedding"] if isinstance(embedding_result, dict) else embedding_result
-        embeddings.append(embedding)
-
-    search_results = []
-    for embedding in embeddings:
-        search_response = index.query(
-            vector=embedding,
-            top_k=k_returns,
-            include_values=False,
-            include_metadata=True
-        )
-        search_results.append(search_response)
+    # One batched embed request for every uncached axis, then all index
+    # queries at once
+    embeddings = await embed_queries(queries)
+    search_results = await asyncio.gather(
+        *(query_search_index(embedding, k_returns) for embedding in embeddings)
+    )
 
     # Format each result like search_vectors does
     formatted_results = []
@@ -356,89 +431,370 @@ async def get_coordinates(
         matches = [{"id": match.get("id", ""), "score": match.get("score", 0)} for match in search_response.matches]
         formatted_results.append(matches)
 
-    return {
+    content = {
         "status": "success",
         "queries": queries,
         "results_count": sum(len(r) for r in formatted_results),
-        "results": formatted_results
+        "results": formatted_results,
+        "coordinates": join_axis_scores(formatted_results)
     }
+    if wants_arrow(request):
+        # One row per site present on every axis: id plus x, y (and z) scores
+        started = time.perf_counter()
+        coordinates = content["coordinates"]
+        columns = {"id": [c["id"] for c in coordinates]}
+        for axis, name in enumerate(("x", "y", "z")[:len(queries)]):
+            columns[name] = [float(c["scores"][axis]) for c in coordinates]
+        meta = {"status": "success", "queries": queries, "results_count": len(coordinates)}
+        return arrow_response("/get_coordinates", columns_to_table(columns), meta, lambda: content, started)
+    return content
+
+
+def join_axis_scores(axis_results: List[List[dict]]) -> List[dict]:
+    """
+    Site -> score per axis, for the sites that appear in every axis' top k.
+    Ordered by score on the first axis.
+    """
+    per_axis = [{match["id"]: match["score"] for match in matches} for matches in axis_results]
+    first = axis_results[0] if axis_results else []
+    return [
+        {"id": match["id"], "scores": [scores[match["id"]] for scores in per_axis]}
+        for match in first
+        if all(match["id"] in scores for scores in per_axis)
+    ]
+
+def load_new_edges() -> int:
+    """Read browsing_complete rows past the last loaded id and add them to every edge store."""
+    # Each page is turned into column arrays as it arrives, so only one page of
+    # row dicts is alive at a time; the snapshot is rebuilt once at the end
+    pages = []
+    added = 0
+    for page in iter_edge_pages(SUPABASE, after_id=node_stats_store.last_id):
+        if EDGE_BACKEND == "memory":
+            pages.append(edge_graph.page_columns(page))
+        node_stats_store.add_edges(page)
+        added += len(page)
+    edge_graph.add_columns(pages)
+    return added
+
+
+async def refresh_edges():
+    """Pull browsing_complete rows added since the last refresh into the in-memory stores."""
+    global edges_loaded
+    async with edge_refresh_lock:
+        added = await asyncio.to_thread(load_new_edges)
+        edges_loaded = True
+    response_cache.set_version(node_stats_store.last_id)
+    if added:
+        print(f"[Edges] Loaded {added} new edges ({node_stats_store.edges_loaded} total)")
+
+
+async def ensure_edges_loaded():
+    if not edges_loaded:
+        await refresh_edges()
+
+
+def respond(request: Optional[Request], endpoint: str, content: dict, rows_key: str = "results") -> Response:
+    """JSON response, or Arrow IPC of content[rows_key] when the client asks for it (see columnar.py)."""
+    if request is not None and wants_arrow(request) and content.get("status") != "error":
+        started = time.perf_counter()
+        table = rows_to_table(content[rows_key])
+        meta = {k: v for k, v in content.items() if k != rows_key}
+        return arrow_response(endpoint, table, meta, lambda: content, started)
+    return JSONResponse(content=content)
+
+
+async def cached_response(key: tuple, build, request: Optional[Request] = None, endpoint: str = "",
+                          needs_edges: bool = False) -> Response:
+    """
+    Serve key from the response cache, or build the content dict, serialize and cache it.
+    The first call waits for the initial edge load only if the answer comes
+    from the in-memory stores (EDGE_BACKEND=memory, or needs_edges).
+    """
+    if EDGE_BACKEND == "memory" or needs_edges:
+        await ensure_edges_loaded()
+    response_cache.set_version(node_stats_store.last_id)
+    arrow = request is not None and wants_arrow(request)
+    key = key + ("arrow",) if arrow else key
+    body = response_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type=ARROW_MEDIA_TYPE if arrow else "application/json")
+    content = await build()
+    response = respond(request, endpoint, content)
+    if content.get("status") != "error":
+        response_cache.put(key, response.body)
+    return response
+
+
+async def keep_edges_fresh():
+    while True:
+        try:
+            await refresh_edges()
+        except Exception as e:
+            print(f"[Edges] Refresh failed: {str(e)}")
+        await asyncio.sleep(EDGE_REFRESH_SECONDS)
+
+
+# Streaming mode: ?stream=true or "Accept: application/x-ndjson" returns every
+# matching row as newline-delimited JSON, written out page by page as it is
+# read, instead of one page of results in a JSON body
+NDJSON_BATCH_ROWS = 500
+
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    return stream or "application/x-ndjson" in request.headers.get("accept", "")
+
+
+def batched(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def ndjson_response(pages: Iterable[list[dict]]) -> StreamingResponse:
+    # A sync generator: Starlette iterates it in a worker thread, so blocking
+    # Supabase page reads do not stall the event loop
+    def lines():
+        for page in pages:
+            for i in range(0, len(page), NDJSON_BATCH_ROWS):
+                yield "".join(json.dumps(row) + "\n" for row in page[i:i + NDJSON_BATCH_ROWS]).encode("utf-8")
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 
 @app.get("/get_edges")
 async def get_edges(
+    request: Request,
     websites: List[str] = Query(...),
     users: List[int] = Query(...),
     page: int = Query(1),  # Add page number
-    page_size: int = Query(1000)  # Add page size
+    page_size: int = Query(1000, ge=1, le=MAX_EDGE_PAGE_SIZE),  # Add page size
+    stream: bool = Query(False)
 ):
-    # Calculate how much to skip
-    offset = (page - 1) * page_size
-
-    # Run RPC with limit + range
-    query = SUPABASE.rpc("count_users_by_site_pair", {
-        "user_ids": users,
-        "websites": websites
-    }).range(offset, offset + page_size - 1)  # Pagination here
-
-    result = query.execute()
-
-    return JSONResponse(
-        content={
+    if wants_stream(request, stream):
+        if EDGE_BACKEND == "memory":
+            await ensure_edges_loaded()
+            return ndjson_response(batched(edge_graph.pair_counts(websites, users), NDJSON_BATCH_ROWS))
+        return ndjson_response(iter_rpc_pages(SUPABASE, "count_users_by_site_pair", {
+            "user_ids": users,
+            "websites": websites
+        }))
+
+    users, websites = list(canonical(users)), list(canonical(websites))
+
+    async def build():
+        # Calculate how much to skip
+        offset = (page - 1) * page_size
+        if EDGE_BACKEND == "memory":
+            data = edge_graph.pair_counts(websites, users)[offset:offset + page_size]
+        else:
+            # Run RPC with limit + range
+            query = SUPABASE.rpc("count_users_by_site_pair", {
+                "user_ids": users,
+                "websites": websites
+            }).range(offset, offset + page_size - 1)  # Pagination here
+            data = query.execute().data
+        return {
             "status": "success",
             "current_page": page,
             "page_size": page_size,
-            "results_count": len(result.data),
-            "results": result.data
+            "results_count": len(data),
+            "results": data
         }
-    )
+
+    return await cached_response(("get_edges", tuple(users), tuple(websites), page, page_size), build,
+                                 request, "/get_edges")
 
 
 @app.get("/target_edge")
-async def get_target_edge(website1: str = Query(...), website2: str = Query(...), users: List[int] = Query(...)):
-    result = SUPABASE.rpc("count_user_records_between_sites", {
-        "user_ids": users, 
-        "origin_site": website1,
-        "target_site": website2
-    }).execute()
-    return JSONResponse(
-        content={
-            "results_count": len(result.data),
-            "results": result.data
+async def get_target_edge(request: Request, website1: str = Query(...), website2: str = Query(...), users: List[int] = Query(...)):
+    users = list(canonical(users))
+
+    async def build():
+        if EDGE_BACKEND == "memory":
+            data = edge_graph.pair_records(website1, website2, users)
+        else:
+            data = SUPABASE.rpc("count_user_records_between_sites", {
+                "user_ids": users, 
+                "origin_site": website1,
+                "target_site": website2
+            }).execute().data
+        return {
+            "results_count": len(data),
+            "results": data
         }
-    )
+
+    return await cached_response(("target_edge", website1, website2, tuple(users)), build,
+                                 request, "/target_edge")
+
+# Edge lists are paged with an opaque cursor over (user, order, id): pass the
+# previous response's next_cursor to get the following page. page > 1 without
+# a cursor still falls back to offset paging for older clients.
+EXPORT_PAGE_SIZE = 5000
+
+
+async def edges_page(after, page_size: int, user: Optional[int] = None) -> list[dict]:
+    if EDGE_BACKEND == "memory":
+        await ensure_edges_loaded()
+        return edge_graph.edges_after(after, page_size, user=user)
+    return await asyncio.to_thread(fetch_edges_after, SUPABASE, after, page_size, user)
+
+
+def cursor_error(e: ValueError) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+
 
 @app.get("/user_edges")
 async def get_user_edges(
+    request: Request,
     user_id: int = Query(...),
     page: int = Query(1),
-    page_size: int = Query(1000)
+    page_size: int = Query(1000, ge=1, le=MAX_EDGE_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    stream: bool = Query(False)
 ):
-    offset = (page - 1) * page_size
-    result = SUPABASE.table("browsing_complete")\
-        .select("*")\
-        .eq("user", user_id)\
-        .range(offset, offset + page_size - 1)\
-        .execute()
-
-    return JSONResponse(
-        content={
-            "results_count": len(result.data),
-            "results": result.data
-        }
-    )
+    if wants_stream(request, stream):
+        if EDGE_BACKEND == "memory":
+            await ensure_edges_loaded()
+            return ndjson_response(batched(edge_graph.iter_user_edges(user_id), NDJSON_BATCH_ROWS))
+        return ndjson_response(iter_edge_pages(SUPABASE, columns="*", user=user_id))
+
+    if page > 1 and cursor is None:
+        offset = (page - 1) * page_size
+        if EDGE_BACKEND == "memory":
+            await ensure_edges_loaded()
+            data = edge_graph.user_edges(user_id, offset, page_size)
+        else:
+            # Same (order, id) order as the cursor path and the in-memory graph,
+            # so offset pages are stable
+            data = SUPABASE.table("browsing_complete")\
+                .select("*")\
+                .eq("user", user_id)\
+                .order("order")\
+                .order("id")\
+                .range(offset, offset + page_size - 1)\
+                .execute().data
+        return respond(request, "/user_edges", {
+            "results_count": len(data),
+            "results": data
+        })
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return cursor_error(e)
+    data = await edges_page(after, page_size, user=user_id)
 
-# gets all of the edges of a particular user
+    return respond(request, "/user_edges", {
+        "results_count": len(data),
+        "results": data,
+        "next_cursor": encode_cursor(edge_key(data[-1])) if len(data) == page_size else None
+    })
 
-from fastapi import Query
-from typing import Optional
+
+@app.get("/export_edges")
+async def export_edges(cursor: Optional[str] = Query(None), page_size: int = Query(EXPORT_PAGE_SIZE, ge=1, le=MAX_EDGE_PAGE_SIZE)):
+    """
+    Full edge export, one cursor page per call. The first call (no cursor)
+    also returns the total row count and the number of calls it will take.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return cursor_error(e)
+    data = await edges_page(after, page_size)
+
+    content = {
+        "results_count": len(data),
+        "results": data,
+        "next_cursor": encode_cursor(edge_key(data[-1])) if len(data) == page_size else None
+    }
+    if cursor is None:
+        if EDGE_BACKEND == "memory":
+            total = edge_graph.stats()["edges"]
+        else:
+            total = await asyncio.to_thread(count_edges, SUPABASE)
+        content["total"] = total
+        content["total_pages"] = max(1, -(-total // page_size))
+    return JSONResponse(content=content)
+
+
+@app.get("/edge-graph-stats")
+async def get_edge_graph_stats():
+    return edge_graph.stats()
+
+
+@app.get("/domains")
+async def get_domains(names: Optional[List[str]] = Query(None), ids: Optional[List[int]] = Query(None)):
+    """Two-way lookup in the domain dictionary: domain -> id and id -> domain."""
+    names = names or []
+    ids = [i for i in ids or [] if 0 <= i < len(domain_dictionary)]
+    return {
+        "size": len(domain_dictionary),
+        "ids": dict(zip(names, domain_dictionary.lookup_many(names).tolist())),
+        "names": dict(zip(ids, domain_dictionary.names_of(ids)))
+    }
+
+
+# Local models (DistilBERT, BLIP, CLIP) are not loaded at startup. Their
+# modules register loaders with the model registry when first imported, and
+# each model loads on first use or through /warmup.
+MODEL_MODULES = ("text_processing", "img_processing")
+MODEL_IDLE_CHECK_SECONDS = 60
+
+
+async def unload_idle_models():
+    while True:
+        await asyncio.sleep(MODEL_IDLE_CHECK_SECONDS)
+        try:
+            await asyncio.to_thread(models.unload_idle)
+        except Exception as e:
+            print(f"[Models] Idle unload failed: {str(e)}")
+
+
+@app.post("/warmup")
+async def warmup(names: Optional[List[str]] = Query(None)):
+    """Load the named models (all registered models by default) ahead of use."""
+    try:
+        for module in MODEL_MODULES:
+            await asyncio.to_thread(importlib.import_module, module)
+        unknown = [n for n in names or [] if n not in models.entries]
+        if unknown:
+            return JSONResponse(
+                status_code=404,
+                content={"status": "error", "message": f"Unknown models: {unknown}", "models": list(models.entries)}
+            )
+        loaded = await asyncio.to_thread(models.warmup, names)
+        return {"status": "success", "loaded": loaded, **models.stats()}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/models")
+async def get_models():
+    return models.stats()
+
+
+@app.get("/response-cache-stats")
+async def get_response_cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/response-format-stats")
+async def get_response_format_stats():
+    """Arrow response sizes and serialization times, with sampled savings against JSON."""
+    return format_stats.report()
 
 @app.get("/get_node_statistics")
 async def get_node_statistics(
     node: str = Query(...),
-    mode: str = Query('origin')  # 'origin' or 'target'
+    mode: str = Query('origin'),  # 'origin' or 'target'
+    users: Optional[List[int]] = Query(None),  # defaults to users 0–8
+    start: Optional[str] = Query(None),  # inclusive YYYY-MM-DD on origin_start
+    end: Optional[str] = Query(None)
 ):
     """
-    Fetch edges where the node matches (origin or target),
-    for users 0–8, and compute:
+    Visit statistics for a node as origin or target, served from the
+    materialized aggregates in node_stats.py:
     - visit_count
     - total_time_spent (seconds)
     - avg_time_per_visit
@@ -447,144 +803,135 @@ async def get_node_statistics(
     if mode not in ['origin', 'target']:
         return {"status": "error", "message": "Mode must be 'origin' or 'target'"}
 
-    try:
-        # Users to consider
+    # Users to consider
+    if users is None:
         users = list(range(9))
+    users = list(canonical(users))
 
-        # Query edges dynamically
-        query = SUPABASE.table("browsing_complete")\
-            .select("*")\
-            .in_("user", users)\
-            .eq(mode, node)\
-            .execute()
+    async def build():
+        visit_count, total_time_spent = node_stats_store.stats(node, mode, users, start, end)
 
-        if not query.data:
+        if visit_count == 0:
             return {"status": "error", "message": f"No edges found for node '{node}' in mode '{mode}'."}
 
-        edges = query.data
-
-        # Now process the edges
-        visit_count = len(edges)
-        total_time_spent = 0
-
-        for edge in edges:
-            time_spent = edge.get('time_active')
-            if isinstance(time_spent, (int, float)):
-                total_time_spent += time_spent
-            # else skip (missing or malformed)
-
         avg_time_per_visit = total_time_spent / visit_count if visit_count > 0 else 0
 
         return {
             "status": "success",
             "node": node,
             "mode": mode,
+            "users": users,
+            "start": start,
+            "end": end,
             "visit_count": visit_count,
             "total_time_spent": round(total_time_spent, 2),  # seconds
             "avg_time_per_visit": round(avg_time_per_visit, 2)  # seconds
         }
 
+    try:
+        return await cached_response(("node_statistics", node, mode, tuple(users), start, end), build,
+                                     needs_edges=True)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-# CSV_FILE = "rankings_all.csv"
+RELEVANT_SITES_PATH = "relevant_sites_smaller.csv"
 
-# @app.post("/precompute_rankings")
-# async def precompute_rankings(batch_size: int = 3, k_returns: int = 500):
-#     try:
-#         from pinecone import Pinecone  # make sure imported correctly at top
+# /precompute_rankings only reads vocabulary files from this directory
+VOCABULARY_DIR = os.getenv("VOCABULARY_DIR", "vocabularies")
 
-#         pc = Pinecone(api_key=os.getenv("PINECONE_KEY"))
-#         index = pc.Index(host=os.getenv("PINECONE_INDEX_HOST"))
+# Only one precompute job runs per process; its status stays queryable
+precompute_job: Optional[PrecomputeJob] = None
+precompute_task: Optional[asyncio.Task] = None
 
-#         queries = [
-#             "piece", "heavy", "organic", "ash", "light", 
-#             "soft", "silk", "smooth", "sharp", "fuzzy"
-#         ]
 
-#         filename = "precomputed_rankings.csv"
+class PrecomputeRequest(BaseModel):
+    # Axis words to rank; may be combined with a newline-separated file
+    vocabulary: List[str] = []
+    vocabulary_file: Optional[str] = None  # file name inside VOCABULARY_DIR
+    k_returns: int = 500
 
-#         # Open CSV once and write header
-#         with open(filename, mode="w", newline='') as csvfile:
-#             writer = csv.writer(csvfile)
-#             writer.writerow(["query", "rank", "website_id", "score"])
 
-#         async def embed_and_search(query: str):
-#             try:
-#                 print(f"🔵 Processing query: {query}")
-#                 await gemini_rate_limiter.wait_if_needed()
-#                 embedding_result = await generate_embedding(query)
-#                 embedding = embedding_result["embedding"] if isinstance(embedding_result, dict) else embedding_result
-
-#                 search_results = index.query(
-#                     vector=embedding,
-#                     top_k=k_returns,
-#                     include_values=False,
-#                     include_metadata=True
-#                 )
-
-#                 with open(filename, mode="a", newline='') as csvfile:
-#                     writer = csv.writer(csvfile)
-#                     for rank, match in enumerate(search_results.matches):
-#                         writer.writerow([
-#                             query,
-#                             rank + 1,
-#                             match.get("id", ""),
-#                             match.get("score", 0)
-#                         ])
-#                 print(f"✅ Finished query: {query}")
+def vocabulary_path(name: str) -> Optional[str]:
+    """Path of a vocabulary file in VOCABULARY_DIR, or None if name points anywhere else."""
+    if not name or os.path.basename(name) != name:
+        return None
+    root = os.path.realpath(VOCABULARY_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    return path if os.path.dirname(path) == root else None
 
-#             except Exception as e:
-#                 print(f"❌ Error with query '{query}': {e}")
-#                 if "exhausted" in str(e).lower() or "quota" in str(e).lower():
-#                     print(f"⏳ Waiting 65s due to quota limit...")
-#                     await asyncio.sleep(65)
-#                     await embed_and_search(query)  # Retry automatically after waiting
-#                 else:
-#                     raise
 
-#         # Run queries in batches
-#         for i in range(0, len(queries), batch_size):
-#             batch = queries[i:i+batch_size]
-#             print(f"🚀 Starting batch: {batch}")
-#             await asyncio.gather(*(embed_and_search(q) for q in batch))
-#             print(f"✅ Batch complete.\n")
+def read_relevant_sites() -> Optional[set]:
+    if not os.path.exists(RELEVANT_SITES_PATH):
+        return None
+    return set(pd.read_csv(RELEVANT_SITES_PATH)["origin"].dropna())
 
-#         return {"status": "done", "output_file": filename}
 
-#     except Exception as e:
-#         return JSONResponse(content={"status": "error", "message": str(e)})
+def read_vocabulary(path: str) -> List[str]:
+    with open(path, "r") as file:
+        return [line.strip() for line in file]
+
+
+@app.post("/precompute_rankings")
+async def precompute_rankings(request: PrecomputeRequest):
+    global precompute_job, precompute_task
+    if precompute_task is not None and not precompute_task.done():
+        return {"status": "running", **precompute_job.status()}
+
+    vocabulary = list(request.vocabulary)
+    if request.vocabulary_file:
+        path = vocabulary_path(request.vocabulary_file)
+        if path is None:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": "vocabulary_file must be a file name in VOCABULARY_DIR"}
+            )
+        try:
+            vocabulary.extend(await asyncio.to_thread(read_vocabulary, path))
+        except FileNotFoundError:
+            return JSONResponse(
+                status_code=400,
+                content={"status": "error", "message": f"Vocabulary file '{request.vocabulary_file}' not found"}
+            )
+
+    valid_sites = await asyncio.to_thread(read_relevant_sites)
+
+    precompute_job = PrecomputeJob(
+        vocabulary,
+        embed_queries,
+        query_search_index,
+        k_returns=request.k_returns,
+        valid_sites=valid_sites
+    )
+    precompute_task = asyncio.create_task(precompute_job.run())
+    return {"status": "started", **precompute_job.status()}
+
+
+@app.get("/precompute_rankings/status")
+async def precompute_rankings_status():
+    if precompute_job is None:
+        return {"status": "error", "message": "No precompute job has been started."}
+    return {"status": "success", **precompute_job.status()}
 
 
 @app.get("/get_precomputed_rankings")
-async def get_precomputed_rankings(query: str = Query(...)):
-    filename = "precomputed_rankings.csv"
-    
+async def get_precomputed_rankings(request: Request, query: str = Query(...)):
     try:
-        df = pd.read_csv(filename)
-        query_df = df[df['query'] == query].copy()
-        
-        if query_df.empty:
+        snapshot = await rankings_store.current()
+        if wants_arrow(request):
+            started = time.perf_counter()
+            columns = snapshot.columns(query)
+            if columns is None:
+                return {"status": "error", "message": f"No rankings found for query '{query}'."}
+            return arrow_response(
+                "/get_precomputed_rankings", columns_to_table(columns), {"status": "success", "query": query},
+                lambda: json.loads(snapshot.response(query)), started
+            )
+
+        body = snapshot.response(query)
+        if body is None:
             return {"status": "error", "message": f"No rankings found for query '{query}'."}
-        
-        query_df.sort_values("rank", inplace=True)
-        
-        results = [
-            {
-                "rank": int(row["rank"]),
-                "id": row["website_id"],
-                "isValidDomain": row["isValidDomain"],
-                "score": float(row["score"])
-            }
-            for _, row in query_df.iterrows()
-        ]
-        
-        return {
-            "status": "success",
-            "query": query,
-            "results": results
-        }
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         return {"status": "error", "message": str(e)}
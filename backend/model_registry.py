@@ -0,0 +1,113 @@
+import gc
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import psutil
+
+# Lazily loaded ML models.
+#
+# Modules register a loader per model instead of loading weights at import
+# time. A model is loaded on first get() (or by warmup()), and
+# unload_idle() drops models nobody has used for MODEL_IDLE_SECONDS so their
+# memory is returned. Load time and the process RSS growth seen during each
+# load are kept for stats().
+
+MODEL_IDLE_SECONDS = float(os.getenv("MODEL_IDLE_SECONDS", "900"))
+
+
+class ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], object]):
+        self.name = name
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.model = None
+        self.loads = 0
+        self.unloads = 0
+        self.load_seconds: Optional[float] = None
+        self.rss_delta_bytes: Optional[int] = None
+        self.last_used = 0.0
+
+
+class ModelRegistry:
+    def __init__(self, idle_seconds: float = MODEL_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.entries: dict[str, ModelEntry] = {}
+        self.process = psutil.Process()
+
+    def register(self, name: str, loader: Callable[[], object]):
+        if name not in self.entries:
+            self.entries[name] = ModelEntry(name, loader)
+
+    def get(self, name: str):
+        """The loaded model for name, loading it first if needed."""
+        entry = self.entries[name]
+        entry.last_used = time.monotonic()
+        model = entry.model
+        if model is not None:
+            return model
+        with entry.lock:
+            if entry.model is None:
+                rss_before = self.process.memory_info().rss
+                start = time.perf_counter()
+                entry.model = entry.loader()
+                entry.load_seconds = time.perf_counter() - start
+                entry.rss_delta_bytes = self.process.memory_info().rss - rss_before
+                entry.loads += 1
+                print(f"[Models] Loaded {name} in {entry.load_seconds:.1f}s "
+                      f"(+{entry.rss_delta_bytes / 1e6:.0f} MB RSS)")
+            entry.last_used = time.monotonic()
+            return entry.model
+
+    def warmup(self, names: Optional[list[str]] = None) -> list[str]:
+        names = list(self.entries) if not names else names
+        for name in names:
+            self.get(name)
+        return names
+
+    def unload(self, name: str) -> bool:
+        entry = self.entries[name]
+        with entry.lock:
+            if entry.model is None:
+                return False
+            entry.model = None
+            entry.unloads += 1
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        print(f"[Models] Unloaded {name}")
+        return True
+
+    def unload_idle(self) -> list[str]:
+        now = time.monotonic()
+        idle = [
+            name for name, entry in self.entries.items()
+            if entry.model is not None and now - entry.last_used > self.idle_seconds
+        ]
+        return [name for name in idle if self.unload(name)]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "process_rss_bytes": self.process.memory_info().rss,
+            "idle_unload_seconds": self.idle_seconds,
+            "models": {
+                name: {
+                    "loaded": entry.model is not None,
+                    "loads": entry.loads,
+                    "unloads": entry.unloads,
+                    "last_load_seconds": round(entry.load_seconds, 2) if entry.load_seconds is not None else None,
+                    "last_load_rss_bytes": entry.rss_delta_bytes,
+                    "idle_seconds": round(now - entry.last_used, 1) if entry.model is not None else None,
+                }
+                for name, entry in self.entries.items()
+            },
+        }
+
+
+models = ModelRegistry()
@@ -0,0 +1,69 @@
+import threading
+from collections import defaultdict
+from typing import Iterable, Optional
+
+# Materialized per-node visit statistics.
+#
+# Instead of pulling every matching browsing_complete row on each request,
+# edges are folded once into running totals keyed by
+# (mode, node) -> (user, day) -> [visit_count, total_time_active].
+# New edges are folded in incrementally with add_edges(). Queries sum the buckets
+# for the requested users and day range, so they never touch the database.
+
+MODES = ("origin", "target")
+
+
+class NodeStatsStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals: dict[tuple[str, str], dict[tuple[int, str], list]] = defaultdict(dict)
+        self.last_id = 0
+        self.edges_loaded = 0
+
+    def add_edges(self, edges: Iterable[dict]):
+        """Fold edge rows into the aggregates."""
+        with self.lock:
+            for edge in edges:
+                user = edge.get("user")
+                day = (edge.get("origin_start") or "")[:10]
+                time_active = edge.get("time_active")
+                if not isinstance(time_active, (int, float)):
+                    time_active = 0
+                for mode in MODES:
+                    node = edge.get(mode)
+                    if node is None:
+                        continue
+                    bucket = self.totals[(mode, node)].get((user, day))
+                    if bucket is None:
+                        self.totals[(mode, node)][(user, day)] = [1, time_active]
+                    else:
+                        bucket[0] += 1
+                        bucket[1] += time_active
+                self.edges_loaded += 1
+                if edge.get("id", 0) > self.last_id:
+                    self.last_id = edge["id"]
+
+    def stats(self, node: str, mode: str, users: Optional[list[int]] = None,
+              start: Optional[str] = None, end: Optional[str] = None) -> tuple[int, float]:
+        """
+        (visit_count, total_time_active) for a node. users=None means all
+        users; start/end are inclusive ISO dates (YYYY-MM-DD) on origin_start.
+        """
+        user_set = set(users) if users is not None else None
+        start_day = start[:10] if start else None
+        end_day = end[:10] if end else None
+
+        visit_count = 0
+        total_time = 0
+        with self.lock:
+            buckets = list(self.totals.get((mode, node), {}).items())
+        for (user, day), (count, time_active) in buckets:
+            if user_set is not None and user not in user_set:
+                continue
+            if start_day and day < start_day:
+                continue
+            if end_day and day > end_day:
+                continue
+            visit_count += count
+            total_time += time_active
+        return visit_count, total_time
@@ -1,5 +1,4 @@
 import requests
-import time
 
 
 websites = [
@@ -508,33 +507,41 @@ websites = [
 
 
 
-base_url = "http://127.0.0.1:8000/embed-website"
+base_url = "http://127.0.0.1:8000/embed-websites"
 
+# URLs per bulk request
+BATCH_SIZE = 1000
 
-def main():
-    for website in websites:
+
+def to_url(website: str) -> str:
+    # Ensure the URL has a scheme (http/https)
+    if not website.startswith(('http://', 'https://')):
+        return f"https://{website}"
+    return website
+
+
+def main(sites=websites):
+    urls = [to_url(w.strip()) for w in sites if w.strip()]
+    for i in range(0, len(urls), BATCH_SIZE):
+        batch = urls[i:i + BATCH_SIZE]
         try:
-            # Ensure the URL has a scheme (http/https)
-            if not website.startswith(('http://', 'https://')):
-                url_to_send = f"https://{website}"
-            else:
-                url_to_send = website
-                
-            print(f"Processing: {url_to_send}")
-            
-            response = requests.post(base_url, data={"url": url_to_send})
-            
-            print(f"Response: {response.status_code} - {response.json()}")
-            
-            # Add a small delay to avoid overwhelming the server
-            time.sleep(.5)
-            
+            print(f"Submitting {len(batch)} urls ({i + len(batch)}/{len(urls)})")
+            response = requests.post(base_url, json={"urls": batch})
+            body = response.json()
+            print(f"Response: {response.status_code} - existing={body.get('existing')} queued={body.get('queued')} already_queued={body.get('already_queued')}")
         except Exception as e:
-            print(f"Error processing {website}: {str(e)}")
+            print(f"Error submitting batch starting at {i}: {str(e)}")
             continue
 
-print("Finished processing all websites")
+    print("Finished processing all websites")
 
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+
+    # Optionally backfill from a domain list file, e.g. domain_set.txt
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r") as file:
+            main(file.readlines())
+    else:
+        main()
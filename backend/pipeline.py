@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from job_store import JobStore
+from rate_limiter import TokenBucket
+
+# Staged embed pipeline: crawl -> describe -> embed -> upsert.
+#
+# Each stage has its own bounded asyncio queue, its own number of workers and
+# optionally its own rate limiter. A stage that gets ahead blocks on the next
+# stage's full queue, so crawled HTML and screenshots never pile up in memory
+# while the quota-bound Gemini stages are the bottleneck.
+#
+# Items flowing through the pipeline are dicts carrying at least "job_id" and
+# "url". A stage function takes an item and returns the item for the next
+# stage. It raises PipelineError to fail the job with a message. A stage with
+# a skip_if predicate passes matching items straight through, without running
+# or spending its rate limit.
+
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "3"))
+DESCRIBE_WORKERS = int(os.getenv("DESCRIBE_WORKERS", "4"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+# Upsert workers wait for their vector's batch to be written, so there must be
+# about as many as UPSERT_BATCH_SIZE for batches to fill up
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "100"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_EVICT_INTERVAL = float(os.getenv("JOB_EVICT_INTERVAL", "600"))
+
+StageFunc = Callable[[dict], Awaitable[dict]]
+SkipPredicate = Callable[[dict], bool]
+
+
+class PipelineError(Exception):
+    pass
+
+
+def is_quota_error(e: Exception) -> bool:
+    message = str(e).lower()
+    return "rate limit" in message or "quota" in message or "exhausted" in message
+
+
+class Stage:
+    def __init__(self, name: str, func: StageFunc, workers: int, limiter: Optional[TokenBucket] = None,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, skip_if: Optional[SkipPredicate] = None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.limiter = limiter
+        self.skip_if = skip_if
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "avg_seconds": round(self.seconds / self.processed, 3) if self.processed else 0.0,
+        }
+
+
+class EmbedPipeline:
+    def __init__(self, store: JobStore, stages: list[Stage], poll_interval: float = JOB_POLL_INTERVAL):
+        self.store = store
+        self.stages = stages
+        self.poll_interval = poll_interval
+        self.tasks: list[asyncio.Task] = []
+        self.in_flight: set[str] = set()
+        self.worker_id = f"{os.getpid()}-pipeline"
+        self.started_at: Optional[float] = None
+        self.pages_done = 0
+        self.pages_failed = 0
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.tasks.append(asyncio.create_task(self._feed()))
+        self.tasks.append(asyncio.create_task(self._keep_leases()))
+        self.tasks.append(asyncio.create_task(self._evict_periodically()))
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for _ in range(stage.workers):
+                self.tasks.append(asyncio.create_task(self._work(stage, next_stage)))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # Anything still in flight keeps its lease and is retried once it expires
+
+    async def _feed(self):
+        first = self.stages[0]
+        while True:
+            try:
+                # Only lease a job when the first stage has room for it
+                while first.queue.full():
+                    await asyncio.sleep(0.05)
+                claimed = await asyncio.to_thread(self.store.claim, self.worker_id)
+                if claimed is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                job_id, url = claimed
+                self.in_flight.add(job_id)
+                await first.queue.put({"job_id": job_id, "url": url})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Pipeline] Feeder error: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _work(self, stage: Stage, next_stage: Optional[Stage]):
+        while True:
+            item = await stage.queue.get()
+            if stage.skip_if is not None and stage.skip_if(item):
+                stage.skipped += 1
+                stage.queue.task_done()
+                await self._forward(item, next_stage)
+                continue
+
+            stage.busy += 1
+            start = time.perf_counter()
+            try:
+                if stage.limiter is not None:
+                    await stage.limiter.acquire()
+                item = await stage.func(item)
+                stage.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stage.failed += 1
+                await self._fail(item, stage, e)
+                continue
+            finally:
+                stage.seconds += time.perf_counter() - start
+                stage.busy -= 1
+                stage.queue.task_done()
+
+            await self._forward(item, next_stage)
+
+    async def _forward(self, item: dict, next_stage: Optional[Stage]):
+        if next_stage is not None:
+            # Blocks while the next stage is saturated (backpressure)
+            await next_stage.queue.put(item)
+        else:
+            await self._complete(item)
+
+    async def _complete(self, item: dict):
+        self.in_flight.discard(item["job_id"])
+        self.pages_done += 1
+        result = {"status": "completed", "cached": item.get("cached", False)}
+        if item.get("description") is not None:
+            result["description"] = item["description"]
+        await asyncio.to_thread(self.store.finish, item["job_id"], result)
+
+    async def _fail(self, item: dict, stage: Stage, e: Exception):
+        job_id, url = item["job_id"], item["url"]
+        self.in_flight.discard(job_id)
+        if is_quota_error(e):
+            await asyncio.to_thread(self.store.requeue, job_id, "Hit rate limit, job requeued")
+            print(f"requeued {url}")
+            return
+        self.pages_failed += 1
+        print(f"[Pipeline] {stage.name} failed for {url}: {str(e)}")
+        await asyncio.to_thread(self.store.finish, job_id, {
+            "status": "error",
+            "message": f"Error: {str(e)}"
+        })
+
+    async def _keep_leases(self):
+        # Jobs can wait in stage queues for a while; renew every in-flight
+        # lease well before it runs out
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            for job_id in list(self.in_flight):
+                try:
+                    await asyncio.to_thread(self.store.extend_lease, job_id, self.worker_id)
+                except Exception as e:
+                    print(f"[Pipeline] Lease renewal failed for {job_id}: {str(e)}")
+
+    async def _evict_periodically(self):
+        # On its own timer: a queue that never runs dry must still drop
+        # expired job records
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.store.evict_finished)
+                if removed:
+                    print(f"[Pipeline] Evicted {removed} finished jobs")
+            except Exception as e:
+                print(f"[Pipeline] Eviction failed: {str(e)}")
+            await asyncio.sleep(JOB_EVICT_INTERVAL)
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "in_flight": len(self.in_flight),
+            "pages_done": self.pages_done,
+            "pages_failed": self.pages_failed,
+            "uptime_seconds": round(elapsed, 1),
+            "pages_per_second": round(self.pages_done / elapsed, 3) if elapsed > 0 else 0.0,
+            "stages": {stage.name: stage.stats() for stage in self.stages},
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Awaitable, Callable, Optional
+
+from pipeline import is_quota_error
+from rankings_store import OFFSETS_METADATA_KEY, RANKINGS_PATH
+
+# Resumable background job that precomputes index rankings for a vocabulary
+# of axis words.
+#
+# Query words are embedded in batches and the index queries for a batch run
+# in parallel while the next batch is being embedded. Each query's rankings
+# are committed to a SQLite checkpoint as soon as they arrive, so a crash or
+# restart resumes with the queries that are still missing. When every query
+# is done, the checkpoint is written out as an Arrow IPC file sorted by
+# (query, rank) at RANKINGS_PATH, where RankingsStore picks it up.
+
+PRECOMPUTE_CHECKPOINT_PATH = os.getenv("PRECOMPUTE_CHECKPOINT_PATH", "precompute_checkpoint.db")
+
+EMBED_BATCH_SIZE = 50
+QUERY_CONCURRENCY = 8
+MAX_RETRIES = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rankings (
+    query TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    website_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (query, rank)
+);
+CREATE TABLE IF NOT EXISTS done (
+    query TEXT PRIMARY KEY,
+    k_returns INTEGER NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+EmbedBatch = Callable[[list[str]], Awaitable[list[list[float]]]]
+QueryOne = Callable[[list[float], int], Awaitable[object]]
+
+
+async def with_retries(make_call: Callable[[], Awaitable], what: str):
+    """Retry quota errors with exponential backoff instead of recursing."""
+    delay = 5.0
+    for attempt in range(MAX_RETRIES):
+        try:
+            return await make_call()
+        except Exception as e:
+            if not is_quota_error(e) or attempt == MAX_RETRIES - 1:
+                raise
+            print(f"[Precompute] Quota hit during {what}, waiting {delay:.0f}s...")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 120.0)
+
+
+class PrecomputeJob:
+    def __init__(self, vocabulary: list[str], embed_batch: EmbedBatch, query_one: QueryOne, k_returns: int = 500,
+                 valid_sites: Optional[set] = None, checkpoint_path: str = PRECOMPUTE_CHECKPOINT_PATH,
+                 output_path: str = RANKINGS_PATH, embed_batch_size: int = EMBED_BATCH_SIZE,
+                 query_concurrency: int = QUERY_CONCURRENCY):
+        self.vocabulary = list(dict.fromkeys(w.strip() for w in vocabulary if w.strip()))
+        self.embed_batch = embed_batch
+        self.query_one = query_one
+        self.k_returns = k_returns
+        self.valid_sites = valid_sites
+        self.checkpoint_path = checkpoint_path
+        self.output_path = output_path
+        self.embed_batch_size = embed_batch_size
+        self.query_slots = asyncio.Semaphore(query_concurrency)
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.completed = 0
+        self.skipped = 0
+        self.started_at: Optional[float] = None
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.checkpoint_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _finished_queries(self) -> set:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT query FROM done WHERE k_returns = ?", (self.k_returns,)).fetchall()
+        return {row[0] for row in rows}
+
+    def _checkpoint(self, query: str, matches: list[tuple[str, float]]):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM rankings WHERE query = ?", (query,))
+            conn.executemany(
+                "INSERT INTO rankings (query, rank, website_id, score) VALUES (?, ?, ?, ?)",
+                [(query, rank, site, score) for rank, (site, score) in enumerate(matches, start=1)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO done (query, k_returns, finished_at) VALUES (?, ?, ?)",
+                (query, self.k_returns, time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    async def _rank(self, query: str, vector: list[float]):
+        async with self.query_slots:
+            response = await with_retries(lambda: self.query_one(vector, self.k_returns), f"query '{query}'")
+        matches = [(m.get("id", ""), float(m.get("score", 0))) for m in response.matches]
+        await asyncio.to_thread(self._checkpoint, query, matches)
+        self.completed += 1
+
+    async def run(self):
+        self.state = "running"
+        self.started_at = time.monotonic()
+        try:
+            finished = await asyncio.to_thread(self._finished_queries)
+            pending = [q for q in self.vocabulary if q not in finished]
+            self.skipped = len(self.vocabulary) - len(pending)
+            print(f"[Precompute] {len(pending)} queries to do, {self.skipped} already checkpointed")
+
+            batches = [pending[i:i + self.embed_batch_size] for i in range(0, len(pending), self.embed_batch_size)]
+            ranking = None
+            for batch in batches:
+                # Embed this batch while the previous batch's queries finish
+                vectors = await with_retries(lambda: self.embed_batch(batch), f"embedding {len(batch)} words")
+                if ranking is not None:
+                    await ranking
+                ranking = asyncio.gather(*(self._rank(q, v) for q, v in zip(batch, vectors)))
+            if ranking is not None:
+                await ranking
+
+            await asyncio.to_thread(self.write_output)
+            self.state = "completed"
+            print(f"[Precompute] Done, wrote {self.output_path}")
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            raise
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            print(f"[Precompute] Failed: {e}")
+
+    def write_output(self):
+        """Write every checkpointed query as an Arrow IPC file sorted by (query, rank)."""
+        import pyarrow as pa
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT r.query, r.rank, r.website_id, r.score FROM rankings r
+                JOIN done d ON d.query = r.query
+                ORDER BY r.query, r.rank
+                """
+            ).fetchall()
+
+        queries = [row[0] for row in rows]
+        sites = [row[2] for row in rows]
+        offsets = {}
+        start = 0
+        for i in range(1, len(queries) + 1):
+            if i == len(queries) or queries[i] != queries[start]:
+                offsets[queries[start]] = [start, i]
+                start = i
+
+        valid = [site in self.valid_sites for site in sites] if self.valid_sites is not None else [True] * len(sites)
+        table = pa.table({
+            "query": pa.array(queries, pa.string()),
+            "rank": pa.array([row[1] for row in rows], pa.int32()),
+            "website_id": pa.array(sites, pa.string()),
+            "score": pa.array([row[3] for row in rows], pa.float64()),
+            "isValidDomain": pa.array(valid, pa.bool_()),
+        })
+        table = table.replace_schema_metadata({OFFSETS_METADATA_KEY: json.dumps(offsets)})
+
+        tmp = self.output_path + ".tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, self.output_path)
+
+    def status(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "state": self.state,
+            "error": self.error,
+            "vocabulary_size": len(self.vocabulary),
+            "already_done": self.skipped,
+            "completed": self.completed,
+            "remaining": len(self.vocabulary) - self.skipped - self.completed,
+            "elapsed_seconds": round(elapsed, 1),
+            "output_file": self.output_path,
+        }
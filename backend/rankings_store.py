@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from domain_dict import DomainDictionary
+
+# In-memory, per-query index of the precomputed rankings.
+#
+# The rankings are held as column arrays sorted by (query, rank) plus a
+# query -> row range table, so a lookup is a dict access and a slice. Each
+# query's JSON response is serialized once and reused. When the file's mtime
+# changes, a new snapshot is built in a worker thread and swapped in whole, so
+# readers never see a half-loaded table and the event loop never waits on it.
+#
+# Two file formats are supported:
+#   - precomputed_rankings.csv, read fully with pandas and pre-serialized; with
+#     a domain dictionary the website ids are held as int32 domain ids
+#   - an Arrow IPC file written by precompute_job.py, memory-mapped, with the
+#     row ranges stored in the schema metadata so loading does not scan it
+
+# /precompute_rankings (precompute_job.py) writes here, and the store serves
+# it. Until a first run has written it, the legacy CSV is served instead.
+RANKINGS_PATH = os.getenv("RANKINGS_PATH", "precomputed_rankings.arrow")
+LEGACY_RANKINGS_PATH = "precomputed_rankings.csv"
+
+# How often (seconds) to stat the file for changes
+RELOAD_CHECK_INTERVAL = 1.0
+
+OFFSETS_METADATA_KEY = b"query_offsets"
+
+
+class RankingsSnapshot:
+    def __init__(self, mtime: float, columns: dict, offsets: dict[str, tuple[int, int]],
+                 dictionary: Optional[DomainDictionary] = None):
+        self.mtime = mtime
+        self.path: Optional[str] = None
+        # rank / score / isValidDomain are numpy arrays; website_id is an int32
+        # array of domain ids (CSV with a dictionary), a numpy object array
+        # (CSV) or a memory-mapped Arrow array
+        self.all_columns = columns
+        self.dictionary = dictionary
+        self.offsets = offsets
+        self.responses: dict[str, bytes] = {}
+
+    def columns(self, query: str) -> Optional[dict]:
+        bounds = self.offsets.get(query)
+        if bounds is None:
+            return None
+        start, end = bounds
+        ids = self.all_columns["website_id"][start:end]
+        if self.dictionary is not None:
+            ids = self.dictionary.names_of(ids)
+        elif isinstance(ids, np.ndarray):
+            ids = ids.tolist()
+        else:
+            ids = ids.to_pylist()
+        return {
+            "rank": self.all_columns["rank"][start:end],
+            "id": ids,
+            "isValidDomain": self.all_columns["isValidDomain"][start:end],
+            "score": self.all_columns["score"][start:end],
+        }
+
+    def response(self, query: str) -> Optional[bytes]:
+        body = self.responses.get(query)
+        if body is not None:
+            return body
+        cols = self.columns(query)
+        if cols is None:
+            return None
+        results = [
+            {"rank": int(rank), "id": site, "isValidDomain": bool(valid), "score": float(score)}
+            for rank, site, valid, score in zip(cols["rank"], cols["id"], cols["isValidDomain"], cols["score"])
+        ]
+        body = json.dumps({
+            "status": "success",
+            "query": query,
+            "results": results
+        }).encode("utf-8")
+        self.responses[query] = body
+        return body
+
+
+def group_offsets(queries: np.ndarray) -> dict[str, tuple[int, int]]:
+    """Row range of each query in an array already sorted by query."""
+    if len(queries) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]])
+    ends = np.r_[starts[1:], len(queries)]
+    return {queries[s]: (int(s), int(e)) for s, e in zip(starts, ends)}
+
+
+def load_csv_snapshot(path: str, mtime: float, dictionary: Optional[DomainDictionary] = None) -> RankingsSnapshot:
+    df = pd.read_csv(path)
+    if "isValidDomain" not in df.columns:
+        df["isValidDomain"] = True
+    df.sort_values(["query", "rank"], inplace=True, kind="stable")
+
+    website_ids = df["website_id"].astype(str)
+    columns = {
+        "rank": df["rank"].to_numpy(dtype=np.int32),
+        "website_id": dictionary.intern_many(website_ids) if dictionary is not None else website_ids.to_numpy(dtype=object),
+        "isValidDomain": df["isValidDomain"].astype(bool).to_numpy(),
+        "score": df["score"].to_numpy(dtype=np.float64),
+    }
+    snapshot = RankingsSnapshot(mtime, columns, group_offsets(df["query"].to_numpy(dtype=object)), dictionary)
+    # The CSV is small; serialize every query up front
+    for query in snapshot.offsets:
+        snapshot.response(query)
+    return snapshot
+
+
+def load_arrow_snapshot(path: str, mtime: float) -> RankingsSnapshot:
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    metadata = table.schema.metadata or {}
+    if OFFSETS_METADATA_KEY in metadata:
+        offsets = {q: tuple(r) for q, r in json.loads(metadata[OFFSETS_METADATA_KEY]).items()}
+    else:
+        offsets = group_offsets(table.column("query").to_numpy(zero_copy_only=False))
+
+    table = table.combine_chunks()
+    columns = {
+        "rank": table.column("rank").to_numpy(),
+        "website_id": table.column("website_id").chunk(0) if table.num_rows else pa.array([], pa.string()),
+        "isValidDomain": table.column("isValidDomain").to_numpy(zero_copy_only=False),
+        "score": table.column("score").to_numpy(),
+    }
+    # Responses are serialized lazily; large vocabularies would not fit eagerly
+    return RankingsSnapshot(mtime, columns, offsets)
+
+
+def load_snapshot(path: str, dictionary: Optional[DomainDictionary] = None) -> RankingsSnapshot:
+    mtime = os.stat(path).st_mtime
+    if path.endswith((".arrow", ".feather")):
+        snapshot = load_arrow_snapshot(path, mtime)
+    else:
+        snapshot = load_csv_snapshot(path, mtime, dictionary)
+    snapshot.path = path
+    return snapshot
+
+
+class RankingsStore:
+    def __init__(self, path: str = RANKINGS_PATH, dictionary: Optional[DomainDictionary] = None,
+                 fallback_path: Optional[str] = LEGACY_RANKINGS_PATH):
+        self.path = path
+        self.fallback_path = fallback_path
+        self.dictionary = dictionary
+        self.snapshot: Optional[RankingsSnapshot] = None
+        self.last_check = 0.0
+        self.reloads = 0
+        self.reload_task: Optional[asyncio.Task] = None
+
+    async def current(self) -> RankingsSnapshot:
+        """
+        The latest loaded snapshot. A changed file is reloaded in a worker
+        thread while requests keep being served from the old snapshot; only
+        the very first load is waited for.
+        """
+        now = time.monotonic()
+        if now - self.last_check >= RELOAD_CHECK_INTERVAL or self.snapshot is None:
+            self.last_check = now
+            if self.reload_task is None or self.reload_task.done():
+                self.reload_task = asyncio.create_task(self._reload())
+            if self.snapshot is None:
+                await self.reload_task
+        return self.snapshot
+
+    async def _reload(self):
+        try:
+            path = await asyncio.to_thread(self._source)
+            mtime = await asyncio.to_thread(lambda: os.stat(path).st_mtime)
+            if self.snapshot is not None and self.snapshot.path == path and self.snapshot.mtime == mtime:
+                return
+            snapshot = await asyncio.to_thread(load_snapshot, path, self.dictionary)
+        except Exception as e:
+            # e.g. the file is mid-rewrite; keep serving the old snapshot
+            if self.snapshot is None:
+                raise
+            print(f"[Rankings] Reload failed, keeping previous snapshot: {e}")
+            return
+        # Swapped in whole; readers hold on to whichever snapshot they got
+        self.snapshot = snapshot
+        self.reloads += 1
+        print(f"[Rankings] Loaded {len(snapshot.offsets)} queries from {path}")
+
+    def _source(self) -> str:
+        if self.fallback_path and not os.path.exists(self.path):
+            return self.fallback_path
+        return self.path
+
+    async def response(self, query: str) -> Optional[bytes]:
+        """Serialized JSON response for a query, or None if it has no rankings."""
+        return (await self.current()).response(query)
+
+    async def columns(self, query: str) -> Optional[dict]:
+        return (await self.current()).columns(query)
+
+    async def queries(self) -> list[str]:
+        return list((await self.current()).offsets.keys())
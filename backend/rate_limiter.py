@@ -0,0 +1,173 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+from typing import Optional
+
+# asyncio token-bucket rate limiting for the external APIs we call.
+#
+# Each bucket refills at `rate_per_minute` and holds up to `burst` tokens.
+# Waiters are served strictly in arrival order (asyncio.Lock wakes waiters
+# FIFO) and sleeping never blocks the event loop.
+#
+# By default a bucket lives in process memory. If RATE_LIMIT_STATE_DIR is set,
+# the bucket state is kept in a small file guarded by flock so every uvicorn
+# worker on the machine draws from the same budget. Reading that file can
+# block on another process's lock, so it is done off the event loop.
+
+RATE_LIMIT_STATE_DIR = os.getenv("RATE_LIMIT_STATE_DIR")
+
+
+class LocalBucketState:
+    # take() and peek() are cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, rate_per_second: float, burst: float):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, tokens: float) -> float:
+        """Consume tokens if available. Returns 0, or seconds until they will be."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def peek(self) -> float:
+        self._refill(time.monotonic())
+        return self.tokens
+
+
+class FileBucketState:
+    """Bucket state shared between processes through a flock'd JSON file."""
+
+    blocking = True
+
+    def __init__(self, path: str, rate_per_second: float, burst: float):
+        self.path = path
+        self.rate = rate_per_second
+        self.burst = burst
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _available(self, raw: str, now: float) -> float:
+        state = json.loads(raw) if raw else {"tokens": self.burst, "updated": now}
+        return min(self.burst, state["tokens"] + max(0.0, now - state["updated"]) * self.rate)
+
+    def take(self, tokens: float) -> float:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        with open(self.path, "a+") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                available = self._available(file.read(), now)
+                wait = 0.0
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / self.rate
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps({"tokens": available, "updated": now}))
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        return wait
+
+    def peek(self) -> float:
+        """Tokens available now. Read-only: the refill is computed, not stored."""
+        now = time.time()
+        try:
+            with open(self.path, "r") as file:
+                fcntl.flock(file, fcntl.LOCK_SH)
+                try:
+                    raw = file.read()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+        except FileNotFoundError:
+            raw = ""
+        return self._available(raw, now)
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate_per_minute: float, burst: Optional[float] = None,
+                 state_dir: Optional[str] = RATE_LIMIT_STATE_DIR):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst if burst is not None else max(1.0, rate_per_minute / 6)
+        if state_dir:
+            self.state = FileBucketState(os.path.join(state_dir, f"{name}.bucket"), self.rate, self.burst)
+        else:
+            self.state = LocalBucketState(self.rate, self.burst)
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+    async def acquire(self, tokens: float = 1):
+        """Wait (without blocking the loop) until `tokens` are available, then take them."""
+        self.waiting += 1
+        try:
+            async with self.lock:
+                while True:
+                    wait = await self._take(tokens)
+                    if wait <= 0:
+                        return
+                    await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
+
+    async def try_acquire(self, max_wait: float, tokens: float = 1) -> bool:
+        """Acquire only if the expected wait is at most max_wait seconds."""
+        if await self.wait_time(tokens) > max_wait:
+            return False
+        await self.acquire(tokens)
+        return True
+
+    async def wait_time(self, tokens: float = 1) -> float:
+        """Estimated seconds a new caller would wait, counting callers already queued."""
+        needed = tokens * (self.waiting + 1)
+        available = await self._peek()
+        if available >= needed:
+            return 0.0
+        return (needed - available) / self.rate
+
+    async def stats(self) -> dict:
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "waiting": self.waiting,
+            "wait_seconds": round(await self.wait_time(), 3),
+        }
+
+    async def _take(self, tokens: float) -> float:
+        if self.state.blocking:
+            return await asyncio.to_thread(self.state.take, tokens)
+        return self.state.take(tokens)
+
+    async def _peek(self) -> float:
+        if self.state.blocking:
+            return await asyncio.to_thread(self.state.peek)
+        return self.state.peek()
+
+
+# One bucket per upstream quota
+gemini_generate_limiter = TokenBucket("gemini_generate", float(os.getenv("GEMINI_GENERATE_RPM", "30")))
+gemini_embed_limiter = TokenBucket("gemini_embed", float(os.getenv("GEMINI_EMBED_RPM", "30")))
+pinecone_limiter = TokenBucket("pinecone", float(os.getenv("PINECONE_RPM", "600")))
+
+LIMITERS = {
+    limiter.name: limiter
+    for limiter in (gemini_generate_limiter, gemini_embed_limiter, pinecone_limiter)
+}
+
+
+async def limiter_stats() -> dict:
+    return {name: await limiter.stats() for name, limiter in LIMITERS.items()}
@@ -1,28 +1,107 @@
+import os
+
 import torch
-from transformers import DistilBertTokenizer, DistilBertModel
+import numpy as np
+
+from model_registry import models
+from text_projection import load_projection
 
-# Load BERT model and tokenizer
-tokenizer = DistilBertTokenizer.from_pretrained("distilbert-base-uncased")
 device = "cuda" if torch.cuda.is_available() else "cpu"
-model = DistilBertModel.from_pretrained("distilbert-base-uncased").to(device)
 
-# Define projection layer outside the function to ensure it's consistent across calls
-linear_projection = torch.nn.Linear(768, 512).to(device)
+TEXT_MODEL = "distilbert-base-uncased"
+CLS_BATCH_SIZE = 32
+
+# Long texts are split into overlapping token windows; the windows of every
+# text in a call are embedded together in length-sorted batches, and each
+# text's window vectors are pooled into one: "mean" (weighted by window
+# length), "max" or "first"
+TEXT_WINDOW_TOKENS = 510  # 512 minus [CLS] and [SEP]
+TEXT_WINDOW_STRIDE = 384
+TEXT_MAX_WINDOWS = int(os.getenv("TEXT_MAX_WINDOWS", "16"))
+TEXT_POOLING = os.getenv("TEXT_POOLING", "mean")
+
+
+def load_distilbert():
+    from transformers import DistilBertTokenizer, DistilBertModel
+
+    # Load BERT model and tokenizer
+    tokenizer = DistilBertTokenizer.from_pretrained(TEXT_MODEL)
+    model = DistilBertModel.from_pretrained(TEXT_MODEL).to(device)
+    return tokenizer, model
+
+
+models.register("distilbert", load_distilbert)
+
+# Fixed 768 -> 512 projection (text_projection.py), identical in every process
+linear_projection = load_projection()
+
+
+def text_embedding_version() -> str:
+    """Tag stored with text vectors; they need re-embedding only when it changes."""
+    chunking = f"w{TEXT_WINDOW_TOKENS}s{TEXT_WINDOW_STRIDE}x{TEXT_MAX_WINDOWS}-{TEXT_POOLING}"
+    return f"{TEXT_MODEL}/cls/{chunking}/{linear_projection.version}"
+
+
+def token_windows(token_ids: list[int]) -> list[list[int]]:
+    """Overlapping windows of at most TEXT_WINDOW_TOKENS tokens, capped at TEXT_MAX_WINDOWS."""
+    windows = []
+    for start in range(0, max(len(token_ids), 1), TEXT_WINDOW_STRIDE):
+        windows.append(token_ids[start:start + TEXT_WINDOW_TOKENS])
+        if start + TEXT_WINDOW_TOKENS >= len(token_ids) or len(windows) == TEXT_MAX_WINDOWS:
+            break
+    return windows
+
+
+def pool(vectors: np.ndarray, lengths: np.ndarray, pooling: str = TEXT_POOLING) -> np.ndarray:
+    if pooling == "max":
+        return vectors.max(axis=0)
+    if pooling == "first":
+        return vectors[0]
+    weights = np.maximum(lengths, 1).astype(np.float32)
+    return (vectors * weights[:, None]).sum(axis=0) / weights.sum()
+
+
+def pooled_cls_embeddings(texts: list[str], batch_size: int = CLS_BATCH_SIZE,
+                          pooling: str = TEXT_POOLING) -> np.ndarray:
+    """One pooled, unprojected [CLS] vector per text, shape (len(texts), 768)."""
+    tokenizer, model = models.get("distilbert")
+
+    # (text index, window token ids) for every window of every text
+    windows = []
+    for i, text in enumerate(texts):
+        token_ids = tokenizer(text, add_special_tokens=False, truncation=False)["input_ids"]
+        windows.extend((i, w) for w in token_windows(token_ids))
+
+    # Similar lengths batch together, so little of each batch is padding
+    order = sorted(range(len(windows)), key=lambda k: len(windows[k][1]))
+    cls_vectors = np.zeros((len(windows), 768), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        sequences = [[tokenizer.cls_token_id, *windows[k][1], tokenizer.sep_token_id] for k in batch]
+        width = max(len(seq) for seq in sequences)
+        input_ids = torch.full((len(sequences), width), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+        for row, seq in enumerate(sequences):
+            input_ids[row, :len(seq)] = torch.tensor(seq)
+            attention_mask[row, :len(seq)] = 1
+
+        with torch.no_grad():
+            outputs = model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device))
+        cls_vectors[batch] = outputs.last_hidden_state[:, 0, :].cpu().numpy()
+
+    owners = np.array([i for i, _ in windows])
+    lengths = np.array([len(w) for _, w in windows])
+    return np.stack([
+        pool(cls_vectors[owners == i], lengths[owners == i], pooling) for i in range(len(texts))
+    ]) if texts else np.zeros((0, 768), dtype=np.float32)
+
+
+def embed_texts(texts: list[str], batch_size: int = CLS_BATCH_SIZE, pooling: str = TEXT_POOLING) -> np.ndarray:
+    """One projected 512-d vector per text, shape (len(texts), 512)."""
+    # Apply the fixed projection to reduce from 768 to 512 dimensions
+    return linear_projection(pooled_cls_embeddings(texts, batch_size, pooling))
+
 
 def get_text_embeddings(web_text: str):
-    inputs = tokenizer(web_text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    
-    # Forward pass through BERT
-    with torch.no_grad():
-        inputs = {i: k.to(device) for i, k in inputs.items()}
-        outputs = model(**inputs)
-    
-    # Extract the [CLS] token embedding, which represents the entire sentence
-    # The [CLS] token is the first token (index 0) in the sequence
-    cls_embedding = outputs.last_hidden_state[:, 0, :]  # Shape: [batch_size, 768]
-    
-    # Apply the linear projection to reduce from 768 to 512 dimensions
-    projected_embedding = linear_projection(cls_embedding)  # Shape: [batch_size, 512]
-    
     # Convert to a 1D list for the API response
-    return projected_embedding.cpu().detach().numpy()[0].tolist()  # Shape: [512]
\ No newline at end of file
+    return embed_texts([web_text])[0].tolist()  # Shape: [512]
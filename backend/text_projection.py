@@ -0,0 +1,138 @@
+# Fixed 768 -> 512 projection for DistilBERT text embeddings.
+#
+# The projection is a PCA basis fitted once on the vectors embed_texts
+# actually projects: pooled, unprojected DistilBERT vectors
+# (text_processing.pooled_cls_embeddings) of crawled pages' visible text. It
+# is saved to text_projection.npz together with a version id derived from its
+# weights. Every process that loads the file projects identically, so stored
+# vectors and caches stay valid across restarts; vectors are tagged with the
+# version and only need re-embedding when it changes.
+#
+# Until a projection has been fitted, a seeded Gaussian random projection is
+# used. It is also deterministic and has its own version id.
+#
+#   python text_projection.py fit                      # crawl the sites in domain_set.txt
+#   python text_projection.py fit --sites urls.txt     # crawl other sites, one per line
+#   python text_projection.py fit --texts corpus.txt   # visible page texts, one per line
+
+import argparse
+import asyncio
+import hashlib
+import os
+from typing import Optional
+
+import numpy as np
+
+TEXT_PROJECTION_PATH = os.getenv("TEXT_PROJECTION_PATH", "text_projection.npz")
+
+INPUT_DIM = 768
+OUTPUT_DIM = 512
+FALLBACK_SEED = 0
+
+
+class TextProjection:
+    def __init__(self, mean: np.ndarray, components: np.ndarray, version: str):
+        self.mean = mean.astype(np.float32)
+        # (OUTPUT_DIM, INPUT_DIM), one basis vector per row
+        self.components = components.astype(np.float32)
+        self.version = version
+
+    def __call__(self, vectors: np.ndarray) -> np.ndarray:
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def save(self, path: str = TEXT_PROJECTION_PATH):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, mean=self.mean, components=self.components, version=np.array(self.version))
+        os.replace(tmp, path)
+
+
+def weights_version(prefix: str, mean: np.ndarray, components: np.ndarray) -> str:
+    digest = hashlib.sha256()
+    digest.update(mean.astype(np.float32).tobytes())
+    digest.update(components.astype(np.float32).tobytes())
+    return f"{prefix}-{digest.hexdigest()[:16]}"
+
+
+def fit_projection(vectors: np.ndarray, dim: int = OUTPUT_DIM) -> TextProjection:
+    """PCA basis of the given (n, INPUT_DIM) vectors."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if len(vectors) < dim:
+        raise ValueError(f"Need at least {dim} documents to fit a {dim}-dimensional projection, got {len(vectors)}")
+    mean = vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    components = vt[:dim]
+    # SVD signs are arbitrary; pin them so refitting the same data gives the same basis
+    signs = np.sign(components[np.arange(dim), np.abs(components).argmax(axis=1)])
+    components = components * signs[:, None]
+    return TextProjection(mean, components, weights_version("pca", mean, components))
+
+
+def seeded_projection(seed: int = FALLBACK_SEED) -> TextProjection:
+    rng = np.random.default_rng(seed)
+    components = rng.standard_normal((OUTPUT_DIM, INPUT_DIM)) / np.sqrt(INPUT_DIM)
+    return TextProjection(np.zeros(INPUT_DIM), components, f"seeded-{seed}")
+
+
+def load_projection(path: str = TEXT_PROJECTION_PATH) -> TextProjection:
+    """The fitted projection at path, or the seeded fallback if none has been fitted."""
+    if not os.path.exists(path):
+        return seeded_projection()
+    with np.load(path) as data:
+        return TextProjection(data["mean"], data["components"], str(data["version"]))
+
+
+async def crawl_texts(urls: list[str], limit: int) -> list[str]:
+    """Visible text of each site, as crawler_loader embeds it."""
+    from crawl4ai import AsyncWebCrawler
+    from html_text import visible_text
+
+    texts = []
+    async with AsyncWebCrawler() as crawler:
+        for url in urls:
+            try:
+                result = await crawler.arun(url=url)
+            except Exception as e:
+                print(f"[Projection] Crawl failed for {url}: {e}")
+                continue
+            text = visible_text(result.html or "")
+            if text:
+                texts.append(text)
+            if len(texts) >= limit:
+                break
+    return texts
+
+
+def load_corpus(texts_path: Optional[str], sites_path: str, limit: int) -> list[str]:
+    if texts_path:
+        with open(texts_path, "r") as file:
+            return [line.strip() for line in file if line.strip()][:limit]
+    with open(sites_path, "r") as file:
+        urls = [line.strip() for line in file if line.strip()]
+    return asyncio.run(crawl_texts(urls, limit))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["fit", "show"])
+    parser.add_argument("--texts", default=None)
+    parser.add_argument("--sites", default="domain_set.txt")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--output", default=TEXT_PROJECTION_PATH)
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(f"Text projection version: {load_projection(args.output).version}")
+        return
+
+    from text_processing import pooled_cls_embeddings
+
+    texts = load_corpus(args.texts, args.sites, args.limit)
+    print(f"[Projection] Embedding {len(texts)} documents")
+    vectors = pooled_cls_embeddings(texts)
+    projection = fit_projection(vectors)
+    projection.save(args.output)
+    print(f"[Projection] Saved {args.output} (version {projection.version})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from typing import Optional
+
+from rate_limiter import gemini_embed_limiter, pinecone_limiter
+
+# Collects finished embeddings from the crawl workers and writes them to
+# Pinecone in batches, instead of one upsert request per site. Each written
+# batch is also copied into any mirrors (e.g. the local vector store).
+#
+# add() returns a future per vector that resolves once its batch has been
+# written, or fails with UpsertError if the batch had to be dropped, so callers
+# only report a site as indexed after it really is.
+
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+# The timer only exists so a half-full batch doesn't wait forever. New
+# embeddings arrive no faster than the Gemini embed limiter allows (about
+# 30/min by default), so a short timer would decide the batch size instead of
+# UPSERT_BATCH_SIZE. By default it is the time that limiter needs to produce a
+# full batch. Jobs finish only once their batch is written, so a longer timer
+# also means a longer wait before a job reports completed.
+UPSERT_FLUSH_SECONDS = float(os.getenv(
+    "UPSERT_FLUSH_SECONDS", str(UPSERT_BATCH_SIZE / gemini_embed_limiter.rate)))
+
+
+class UpsertError(Exception):
+    pass
+
+
+class UpsertBatcher:
+    def __init__(self, index, batch_size: int = UPSERT_BATCH_SIZE, flush_seconds: float = UPSERT_FLUSH_SECONDS,
+                 namespace: str = "", mirrors: Optional[list] = None):
+        self.index = index
+        self.mirrors = mirrors or []
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.namespace = namespace
+        self.pending: list[tuple[dict, asyncio.Future]] = []
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.upserted = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def add(self, vector_id: str, values: list[float]) -> asyncio.Future:
+        """Queue one vector; writes out a batch once batch_size is reached.
+
+        Returns a future that resolves when the vector's batch is written.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(({"id": vector_id, "values": values}, future))
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        return future
+
+    async def flush(self):
+        async with self.lock:
+            while self.pending:
+                entries = self.pending[:self.batch_size]
+                del self.pending[:self.batch_size]
+                await self._upsert(entries)
+
+    async def _upsert(self, entries: list[tuple[dict, asyncio.Future]]):
+        batch = [vector for vector, _ in entries]
+        error = None
+        for attempt in range(2):
+            try:
+                await pinecone_limiter.acquire()
+                await asyncio.to_thread(self.index.upsert, vectors=batch, namespace=self.namespace)
+                self.upserted += len(batch)
+                print(f"[Upsert] Wrote batch of {len(batch)} vectors.")
+                break
+            except Exception as e:
+                error = e
+                print(f"[Upsert] Batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(1)
+        else:
+            print(f"[Upsert] Dropping batch: {[v['id'] for v in batch]}")
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(UpsertError(f"Upsert failed: {error}"))
+            return
+
+        for mirror in self.mirrors:
+            try:
+                await asyncio.to_thread(mirror.upsert, vectors=batch, namespace=self.namespace)
+            except Exception as e:
+                print(f"[Upsert] Mirror write failed: {e}")
+
+        for _, future in entries:
+            if not future.done():
+                future.set_result(None)
+
+    async def _flush_periodically(self):
+        # Don't let a half-full batch sit forever when the queue runs dry
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()